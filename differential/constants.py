@@ -24,10 +24,20 @@ BOOLEAN_ARGS = (
     "reuse_torrent",
     "scan_bdinfo",
     "create_folder",
+    "keyframe_index",
+    "png_palette",
+    "ptgen_hedge",
+    "refresh_ptgen",
+    "torrent_align_files",
+    "torrent_hybrid",
 )
 
 URL_SHORTENER_PATH = "https://b4.gs/s"
 
+# PTGen重试的退避时间(秒)，实际等待时间在0到退避时间之间随机
+PTGEN_BACKOFF_BASE = 1
+PTGEN_BACKOFF_MAX = 30
+
 
 class ImageHosting(Enum):
     PTPIMG = "ptpimg"
@@ -63,3 +73,33 @@ class ImageHosting(Enum):
         elif s.lower() == "tucang":
             return ImageHosting.TUCANG
         raise ValueError(f"不支持的图床：{s}")
+
+
+# 逐张上传的图床同时上传的截图数量
+IMAGE_HOSTING_CONCURRENCY = {
+    ImageHosting.PTPIMG: 4,
+    ImageHosting.IMGURL: 2,
+    ImageHosting.CHEVERETO: 3,
+    ImageHosting.SMMS: 2,
+    ImageHosting.BYR: 2,
+    ImageHosting.CLOUDINARY: 4,
+    ImageHosting.TUCANG: 2,
+}
+
+
+class ScreenshotMode(Enum):
+    AUTO = "auto"
+    SEEK = "seek"
+    SINGLE = "single"
+
+    @staticmethod
+    def parse(s: str):
+        if isinstance(s, ScreenshotMode):
+            return s
+        if s.lower() == "auto":
+            return ScreenshotMode.AUTO
+        elif s.lower() == "seek":
+            return ScreenshotMode.SEEK
+        elif s.lower() == "single":
+            return ScreenshotMode.SINGLE
+        raise ValueError(f"不支持的截图模式：{s}")
@@ -1,10 +1,41 @@
 import re
+import argparse
+from pathlib import Path
 
 from loguru import logger
 
 from differential.version import version
+from differential.utils.cache import cache_command
+from differential.utils.hashing import HASH_BACKENDS
+from differential.utils.torrent import benchmark_hashing
 from differential.utils.config import merge_config
-from differential.plugins.base import PARSER, REGISTERED_PLUGINS
+from differential.plugins.base import PARSER, REGISTERED_PLUGINS, subparsers
+
+cache_parser = subparsers.add_parser("cache", help="查看或清理差速器的截图、BDInfo等缓存")
+cache_parser.set_defaults(command="cache")
+cache_parser.add_argument("action", choices=["stats", "prune"], help="stats查看缓存占用，prune按大小上限清理缓存")
+cache_parser.add_argument(
+    "-c", "--config", type=str, help="配置文件的路径，默认为config.ini", default="config.ini"
+)
+cache_parser.add_argument(
+    "--cache-size", type=int, help="缓存的总大小上限(MiB)，默认2048，设为0时不限制", default=argparse.SUPPRESS
+)
+cache_parser.add_argument(
+    "--all", action="store_true", dest="clear_all", help="prune时清空所有缓存", default=argparse.SUPPRESS
+)
+
+bench_parser = subparsers.add_parser("hash-bench", help="比较制种时各个哈希计算方式的速度")
+bench_parser.set_defaults(command="hash-bench")
+bench_parser.add_argument("path", type=str, help="用于测试的文件或文件夹")
+bench_parser.add_argument(
+    "--backend", type=str, nargs="+", choices=["torf", *HASH_BACKENDS], help="要测试的方式，默认全部", default=argparse.SUPPRESS
+)
+bench_parser.add_argument("--torrent-workers", type=int, help="计算哈希的线程数，默认为CPU核心数", default=argparse.SUPPRESS)
+bench_parser.add_argument("--torrent-read-size", type=int, help="每次读取的数据量(MiB)，默认16", default=argparse.SUPPRESS)
+bench_parser.add_argument(
+    "--hybrid", action="store_true", help="同时比较v1和v1+v2混合种子的速度", default=argparse.SUPPRESS
+)
+bench_parser.add_argument("--rounds", type=int, help="每种方式测试的次数，取最快的一次，默认2", default=argparse.SUPPRESS)
 
 
 @logger.catch
@@ -17,7 +48,18 @@ def main():
         log = config.pop('log')
         logger.add(log, level="TRACE", backtrace=True, diagnose=True)
 
-    if hasattr(args, 'plugin'):
+    if config.get('command') == 'cache':
+        cache_command(config['action'], config.get('cache_size', 2048) * 1024 * 1024, config.get('clear_all', False))
+    elif config.get('command') == 'hash-bench':
+        benchmark_hashing(
+            Path(config['path']),
+            config.get('backend'),
+            config.get('torrent_workers'),
+            config.get('torrent_read_size', 16) * 1024 * 1024,
+            config.get('rounds', 2),
+            config.get('hybrid', False),
+        )
+    elif hasattr(args, 'plugin'):
         plugin = config.pop('plugin')
         try:
             logger.trace(config)
@@ -2,30 +2,56 @@ import os
 import re
 import sys
 import json
+import time
+import random
 import shutil
 import platform
-import tempfile
 import argparse
 from pathlib import Path
-from typing import Optional
-from itertools import chain
+from typing import Optional, List, Tuple
+from itertools import repeat
 from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from abc import ABC, ABCMeta, abstractmethod
 
-import requests
 from PIL import Image
 from loguru import logger
 from pymediainfo import MediaInfo
+from requests import RequestException
 
 from differential import tools
 from differential.torrent import TorrnetBase
 from differential.version import version
-from differential.constants import ImageHosting
+from differential.constants import (
+    ImageHosting,
+    ScreenshotMode,
+    IMAGE_HOSTING_CONCURRENCY,
+    PTGEN_BACKOFF_BASE,
+    PTGEN_BACKOFF_MAX,
+)
+from differential.utils import network
 from differential.utils.browser import open_link
-from differential.utils.torrent import make_torrent
-from differential.utils.parse import parse_encoder_log
+from differential.utils.torrent import make_torrents, parse_torrent_sites, TorrentSite
+from differential.utils.hashing import HASH_BACKENDS
+from differential.utils.parse import parse_encoder_log, normalize_url
+from differential.utils.pipeline import Stage
+from differential.utils.scheduler import StageScheduler, StagePool
+from differential.utils.cache import ArtifactStore, get_file_fingerprint
+from differential.utils.screenshot import (
+    get_screenshot_timestamps,
+    get_screenshot_name,
+    choose_screenshot_mode,
+    get_keyframe_index,
+    snap_to_keyframes,
+    select_screenshot_timestamps,
+    seek_screenshot,
+    seek_frame,
+    single_pass_screenshots,
+    single_pass_frames,
+    remove_screenshots,
+)
 from differential.utils.uploader import EasyUpload, AutoFeed
-from differential.utils.binary import ffprobe, execute, execute_with_output
+from differential.utils.binary import execute_with_output
 from differential.utils.mediainfo import (
     get_full_mediainfo,
     get_resolution,
@@ -34,6 +60,8 @@ from differential.utils.mediainfo import (
 from differential.utils.image import (
     ImageUploaded,
     get_all_images,
+    optimize_image,
+    encode_image,
     byr_upload,
     hdbits_upload,
     imgbox_upload,
@@ -96,6 +124,9 @@ class PluginRegister(ABCMeta):
 
 
 class Base(ABC, TorrnetBase, metaclass=PluginRegister):
+    # 截图的格式，png或jpg
+    screenshot_format = "png"
+
     @classmethod
     @abstractmethod
     def add_parser(cls, parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
@@ -143,6 +174,30 @@ class Base(ABC, TorrnetBase, metaclass=PluginRegister):
             help="截图数量，默认为0，即不生成截图",
             default=argparse.SUPPRESS,
         )
+        parser.add_argument(
+            "--screenshot-workers",
+            type=int,
+            help="同时运行的截图ffmpeg进程数，默认为CPU核心数",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--screenshot-mode",
+            type=ScreenshotMode,
+            help="截图模式，seek为每张截图单独调用ffmpeg，single为单个ffmpeg进程生成所有截图，auto为根据文件大小和时长自动选择，默认auto",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--keyframe-index",
+            action="store_true",
+            help="是否为视频建立并缓存关键帧索引，截图时间点会对齐到最近的关键帧，默认否",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--screenshot-candidates",
+            type=int,
+            help="每张截图在时间点附近评估的候选帧数量，会跳过黑场、淡入淡出和重复画面，默认为0，即不筛选",
+            default=argparse.SUPPRESS,
+        )
         parser.add_argument(
             "--screenshot-path",
             type=str,
@@ -175,12 +230,49 @@ class Base(ABC, TorrnetBase, metaclass=PluginRegister):
             help="是否压缩截图（无损），默认压缩",
             default=argparse.SUPPRESS,
         )
+        parser.add_argument(
+            "--png-compress-level",
+            type=int,
+            help="压缩PNG截图时zlib的压缩等级，0-9，默认9",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--png-strategy",
+            type=str,
+            choices=["default", "filtered", "huffman", "rle", "fixed"],
+            help="压缩PNG截图时zlib的压缩策略，默认default",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--png-palette",
+            action="store_true",
+            help="截图颜色数不超过256时无损转换为调色板模式，默认否",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--jpeg-quality",
+            type=int,
+            help="截图为JPEG格式时的压缩质量，默认75",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--cache-size",
+            type=int,
+            help="截图、BDInfo等缓存的总大小上限(MiB)，超出后按最近使用时间清理，设为0时不限制，默认2048",
+            default=argparse.SUPPRESS,
+        )
         parser.add_argument(
             "--image-hosting",
             type=ImageHosting,
             help=f"图床的类型，现在支持{','.join(i.value for i in ImageHosting)}",
             default=argparse.SUPPRESS,
         )
+        parser.add_argument(
+            "--upload-workers",
+            type=int,
+            help="逐张上传截图的图床同时上传的截图数量，默认根据图床决定",
+            default=argparse.SUPPRESS,
+        )
         parser.add_argument(
             "--ptpimg-api-key",
             type=str,
@@ -324,9 +416,51 @@ class Base(ABC, TorrnetBase, metaclass=PluginRegister):
         parser.add_argument(
             "--ptgen-retry", type=int, help="PTGEN重试次数，默认为3次", default=argparse.SUPPRESS
         )
+        parser.add_argument(
+            "--ptgen-timeout", type=int, help="单次PTGEN请求的超时时间(秒)，默认15", default=argparse.SUPPRESS
+        )
+        parser.add_argument(
+            "--ptgen-cache-ttl",
+            type=int,
+            help="PTGEN结果的缓存时间(小时)，设为0时不缓存，默认168",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--ptgen-negative-ttl",
+            type=int,
+            help="PTGEN获取失败的结果的缓存时间(分钟)，期间不会重复请求，默认10",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--refresh-ptgen",
+            action="store_true",
+            help="忽略缓存，重新获取PTGEN",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--ptgen-hedge",
+            action="store_true",
+            help="同时请求主PTGEN和备用PTGEN，使用最先成功的结果，默认否",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--ptgen-hedge-delay",
+            type=int,
+            help="开启ptgen-hedge时，主PTGEN多久未返回后请求备用PTGEN(毫秒)，设为0时同时请求，默认2000",
+            default=argparse.SUPPRESS,
+        )
         parser.add_argument(
             "--announce-url", type=str, help="制种时announce地址", default=argparse.SUPPRESS
         )
+        parser.add_argument(
+            "--proxy", type=str, help="网络请求使用的代理，如http://127.0.0.1:7890", default=argparse.SUPPRESS
+        )
+        parser.add_argument(
+            "--user-agent", type=str, help="网络请求使用的User-Agent", default=argparse.SUPPRESS
+        )
+        parser.add_argument(
+            "--http-timeout", type=int, help="网络请求的读取超时时间(秒)，默认60", default=argparse.SUPPRESS
+        )
 
         parser.add_argument(
             "--encoder-log", type=str, help="压制log的路径", default=argparse.SUPPRESS
@@ -365,6 +499,61 @@ class Base(ABC, TorrnetBase, metaclass=PluginRegister):
             help="是否直接在差速器已经制作的种子基础上重新制种",
             default=argparse.SUPPRESS,
         )
+        parser.add_argument(
+            "--torrent-workers",
+            type=int,
+            help="制种时同时计算哈希的线程数，默认为CPU核心数",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--torrent-read-size",
+            type=int,
+            help="制种时每次读取的数据量(MiB)，默认16",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--torrent-backend",
+            type=str,
+            choices=["torf", *HASH_BACKENDS],
+            help="制种时计算哈希的方式，buffered为分段读取，mmap为内存映射，torf为torf自带的实现，默认buffered",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--torrent-verify-samples",
+            type=int,
+            help="复用已有种子前抽样校验的分块数，每个文件的首尾分块总会校验，设为0时不校验，默认16",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--torrent-dirs",
+            type=str,
+            help="BT客户端保存种子的目录，多个目录用分号分隔，复用种子时会在其中查找名称、大小和文件列表都一致的种子",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--torrent-align-files",
+            action="store_true",
+            help="制种时在文件之间插入填充文件，使每个文件从分块边界开始(BEP 47)，并缓存每个文件的分块哈希，适合连载剧集",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--torrent-piece-size",
+            type=int,
+            help="种子的分块大小(KiB)，默认根据总大小自动选择，连载剧集建议固定以便复用已计算的分块哈希",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--torrent-hybrid",
+            action="store_true",
+            help="生成v1+v2混合种子(BEP 52)，一次读取同时计算两种哈希，文件会按分块对齐",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--torrent-sites",
+            type=str,
+            help="同时为其他站点制种，每个站点的格式为：前缀|announce地址|source，多个站点用分号分隔，只计算一次哈希",
+            default=argparse.SUPPRESS,
+        )
         parser.add_argument(
             "--from-torrent",
             type=str,
@@ -380,11 +569,21 @@ class Base(ABC, TorrnetBase, metaclass=PluginRegister):
         upload_url: str,
         screenshot_count: int = 0,
         screenshot_path: str = None,
+        screenshot_workers: int = None,
+        screenshot_mode: ScreenshotMode = ScreenshotMode.AUTO,
+        keyframe_index: bool = False,
+        screenshot_candidates: int = 0,
         optimize_screenshot: bool = True,
+        png_compress_level: int = 9,
+        png_strategy: str = "default",
+        png_palette: bool = False,
+        jpeg_quality: int = 75,
+        cache_size: int = 2048,
         create_folder: bool = False,
         use_short_bdinfo: bool = False,
         scan_bdinfo: bool = True,
         image_hosting: ImageHosting = ImageHosting.PTPIMG,
+        upload_workers: int = 0,
         chevereto_hosting_url: str = "",
         imgurl_hosting_url: str = "",
         ptpimg_api_key: str = None,
@@ -411,6 +610,15 @@ class Base(ABC, TorrnetBase, metaclass=PluginRegister):
         second_ptgen_url: str = "https://ptgen.caosen.com",
         announce_url: str = "https://example.com",
         ptgen_retry: int = 3,
+        ptgen_timeout: int = 15,
+        ptgen_hedge: bool = False,
+        ptgen_cache_ttl: int = 168,
+        ptgen_negative_ttl: int = 10,
+        refresh_ptgen: bool = False,
+        ptgen_hedge_delay: int = 2000,
+        proxy: str = None,
+        user_agent: str = None,
+        http_timeout: int = 60,
         generate_nfo: bool = False,
         make_torrent: bool = False,
         easy_upload: bool = False,
@@ -420,6 +628,15 @@ class Base(ABC, TorrnetBase, metaclass=PluginRegister):
         encoder_log: str = "",
         reuse_torrent: bool = True,
         from_torrent: str = None,
+        torrent_workers: int = None,
+        torrent_read_size: int = 16,
+        torrent_backend: str = "buffered",
+        torrent_sites: str = "",
+        torrent_verify_samples: int = 16,
+        torrent_dirs: str = "",
+        torrent_align_files: bool = False,
+        torrent_piece_size: int = 0,
+        torrent_hybrid: bool = False,
         **kwargs,
     ):
         self.folder = Path(folder)
@@ -427,11 +644,23 @@ class Base(ABC, TorrnetBase, metaclass=PluginRegister):
         self.upload_url = upload_url
         self.screenshot_count = screenshot_count
         self.screenshot_path = screenshot_path
+        self.screenshot_workers = screenshot_workers or os.cpu_count() or 1
+        self.screenshot_mode = screenshot_mode
+        self.keyframe_index = keyframe_index
+        self.screenshot_candidates = screenshot_candidates
         self.optimize_screenshot = optimize_screenshot
+        self.png_compress_level = png_compress_level
+        self.png_strategy = png_strategy
+        self.png_palette = png_palette
+        self.jpeg_quality = jpeg_quality
+        self.cache_size = cache_size
         self.create_folder = create_folder
         self.use_short_bdinfo = use_short_bdinfo
         self.scan_bdinfo = scan_bdinfo
         self.image_hosting = image_hosting
+        self.upload_workers = upload_workers
+        self._screenshot_stage: Optional[Stage] = None
+        self._uploaded_screenshots: Optional[list] = None
         self.chevereto_hosting_url = chevereto_hosting_url
         self.imgurl_hosting_url = imgurl_hosting_url
         self.ptpimg_api_key = ptpimg_api_key
@@ -458,6 +687,13 @@ class Base(ABC, TorrnetBase, metaclass=PluginRegister):
         self.second_ptgen_url = second_ptgen_url
         self.announce_url = announce_url
         self.ptgen_retry = ptgen_retry
+        self.ptgen_timeout = ptgen_timeout
+        self.ptgen_hedge = ptgen_hedge
+        self.ptgen_cache_ttl = ptgen_cache_ttl
+        self.ptgen_negative_ttl = ptgen_negative_ttl
+        self.refresh_ptgen = refresh_ptgen
+        self.ptgen_hedge_delay = ptgen_hedge_delay
+        network.configure(proxy, user_agent, (min(network.DEFAULT_TIMEOUT[0], http_timeout), http_timeout))
         self.generate_nfo = generate_nfo
         self.make_torrent = make_torrent
         self.easy_upload = easy_upload
@@ -467,6 +703,15 @@ class Base(ABC, TorrnetBase, metaclass=PluginRegister):
         self.encoder_log = encoder_log
         self.reuse_torrent = reuse_torrent
         self.from_torrent = from_torrent
+        self.torrent_workers = torrent_workers
+        self.torrent_read_size = torrent_read_size
+        self.torrent_backend = torrent_backend
+        self.torrent_sites = torrent_sites
+        self.torrent_verify_samples = torrent_verify_samples
+        self.torrent_align_files = torrent_align_files
+        self.torrent_piece_size = torrent_piece_size
+        self.torrent_hybrid = torrent_hybrid
+        self.torrent_dirs = [d.strip() for d in re.split(r"[;\n]", torrent_dirs or "") if d.strip()]
 
         self.is_bdmv = False
         self._bdinfo = None
@@ -517,131 +762,242 @@ class Base(ABC, TorrnetBase, metaclass=PluginRegister):
                 for img_url in img_urls:
                     f.write(f"{img_url.url} {img_url.thumb}\n")
         else:
-            for count, img in enumerate(sorted(get_all_images(img_dir))):
-                if img.is_file():
-                    img_url = None
-                    img_url_file = img.resolve().parent.joinpath(
-                        ".{}.{}".format(self.image_hosting.value, img.stem)
-                    )
-                    if img_url_file.is_file():
-                        with open(img_url_file, "r") as f:
-                            line = f.read().strip()
-                            if len(line.split(" ")) > 1:
-                                img_url = ImageUploaded(
-                                    line.split(" ")[0], line.split(" ")[1]
-                                )
-                            else:
-                                img_url = ImageUploaded(line)
-                            logger.info(f"发现已上传的第{count + 1}张截图链接：{img_url}")
-                    else:
-                        if self.image_hosting == ImageHosting.PTPIMG:
-                            img_url = ptpimg_upload(img, self.ptpimg_api_key)
-                        elif self.image_hosting == ImageHosting.CHEVERETO:
-                            if not self.chevereto_hosting_url:
-                                logger.error("Chevereto地址未提供，请设置chevereto_hosting_url")
-                                sys.exit(1)
-                            if self.chevereto_hosting_url.endswith("/"):
-                                self.chevereto_hosting_url = self.chevereto_hosting_url[
-                                    :-1
-                                ]
-                            if self.chevereto_api_key:
-                                img_url = chevereto_api_upload(
-                                    img,
-                                    self.chevereto_hosting_url,
-                                    self.chevereto_api_key,
-                                )
-                            elif self.chevereto_username and self.chevereto_password:
-                                img_url = chevereto_username_upload(
-                                    img,
-                                    self.chevereto_hosting_url,
-                                    self.chevereto_username,
-                                    self.chevereto_password,
-                                )
-                            elif self.chevereto_cookie and self.chevereto_token:
-                                img_url = chevereto_cookie_upload(
-                                    img,
-                                    self.chevereto_hosting_url,
-                                    self.chevereto_cookie,
-                                    self.chevereto_token,
-                                )
-                            else:
-                                logger.error(
-                                    "Chevereto的API或用户名或密码未设置，请检查chevereto-username/chevereto-password设置"
-                                )
-                        elif self.image_hosting == ImageHosting.CLOUDINARY:
-                            if (
-                                not self.cloudinary_cloud_name
-                                or not self.cloudinary_api_key
-                                or not self.cloudinary_api_secret
-                            ):
-                                logger.error(
-                                    "Cloudinary的参数未设置，请检查cloudinary_cloud_name/cloudinary_api_key/cloudinary_api_secret设置"
-                                )
-                            else:
-                                img_url = cloudinary_upload(
-                                    img,
-                                    self.folder.stem,
-                                    self.cloudinary_cloud_name,
-                                    self.cloudinary_api_key,
-                                    self.cloudinary_api_secret,
-                                )
-                        elif self.image_hosting == ImageHosting.IMGURL:
-                            if self.imgurl_hosting_url.endswith("/"):
-                                self.imgurl_hosting_url = self.imgurl_hosting_url[:-1]
-                            img_url = imgurl_upload(
-                                img, self.imgurl_hosting_url, self.imgurl_api_key
-                            )
-                        elif self.image_hosting == ImageHosting.TUCANG:
-                            img_url = tucang_upload(img,  self.tucang_token)
-                        elif self.image_hosting == ImageHosting.SMMS:
-                            img_url = smms_upload(img, self.smms_api_key)
-                        elif self.image_hosting == ImageHosting.BYR:
-                            if (
-                                self.byr_alternative_url
-                                and self.byr_alternative_url.endswith("/")
-                            ):
-                                self.byr_alternative_url = self.byr_alternative_url[:-1]
-                            img_url = byr_upload(
-                                img, self.byr_authorization, self.byr_alternative_url
-                            )
-                    if img_url:
-                        logger.info(f"第{count + 1}张截图地址：{img_url.url}")
-                        with open(img_url_file, "w") as f:
-                            if img_url.thumb:
-                                f.write(f"{img_url.url} {img_url.thumb}")
-                            else:
-                                f.write(f"{img_url.url}")
-                        img_urls.append(img_url)
-                    else:
-                        logger.info(f"第{count + 1}张截图上传失败，请自行上传：{img.resolve()}")
+            self._check_image_hosting()
+            images = [img for img in sorted(get_all_images(img_dir)) if img.is_file()]
+            with ThreadPoolExecutor(max_workers=self._upload_workers()) as executor:
+                results = executor.map(self._upload_screenshot, range(len(images)), images)
+                # executor.map按提交顺序返回结果，保证截图顺序不变
+                img_urls = [img_url for img_url in results if img_url]
         return img_urls
 
-    def _get_ptgen(self, use_second: bool = False) -> dict:
+    def _upload_workers(self) -> int:
+        if self.upload_workers:
+            return self.upload_workers
+        return IMAGE_HOSTING_CONCURRENCY.get(self.image_hosting, 1)
+
+    def _check_image_hosting(self):
+        # 在并发上传前检查并规范化图床参数
+        if self.image_hosting == ImageHosting.CHEVERETO:
+            if not self.chevereto_hosting_url:
+                logger.error("Chevereto地址未提供，请设置chevereto_hosting_url")
+                sys.exit(1)
+            if self.chevereto_hosting_url.endswith("/"):
+                self.chevereto_hosting_url = self.chevereto_hosting_url[:-1]
+        elif self.image_hosting == ImageHosting.IMGURL:
+            if self.imgurl_hosting_url.endswith("/"):
+                self.imgurl_hosting_url = self.imgurl_hosting_url[:-1]
+        elif self.image_hosting == ImageHosting.BYR:
+            if self.byr_alternative_url and self.byr_alternative_url.endswith("/"):
+                self.byr_alternative_url = self.byr_alternative_url[:-1]
+
+    def _upload_image(self, img: Path) -> Optional[ImageUploaded]:
+        if self.image_hosting == ImageHosting.PTPIMG:
+            return ptpimg_upload(img, self.ptpimg_api_key)
+        elif self.image_hosting == ImageHosting.CHEVERETO:
+            if self.chevereto_api_key:
+                return chevereto_api_upload(
+                    img,
+                    self.chevereto_hosting_url,
+                    self.chevereto_api_key,
+                )
+            elif self.chevereto_username and self.chevereto_password:
+                return chevereto_username_upload(
+                    img,
+                    self.chevereto_hosting_url,
+                    self.chevereto_username,
+                    self.chevereto_password,
+                )
+            elif self.chevereto_cookie and self.chevereto_token:
+                return chevereto_cookie_upload(
+                    img,
+                    self.chevereto_hosting_url,
+                    self.chevereto_cookie,
+                    self.chevereto_token,
+                )
+            else:
+                logger.error(
+                    "Chevereto的API或用户名或密码未设置，请检查chevereto-username/chevereto-password设置"
+                )
+        elif self.image_hosting == ImageHosting.CLOUDINARY:
+            if (
+                not self.cloudinary_cloud_name
+                or not self.cloudinary_api_key
+                or not self.cloudinary_api_secret
+            ):
+                logger.error(
+                    "Cloudinary的参数未设置，请检查cloudinary_cloud_name/cloudinary_api_key/cloudinary_api_secret设置"
+                )
+            else:
+                return cloudinary_upload(
+                    img,
+                    self.folder.stem,
+                    self.cloudinary_cloud_name,
+                    self.cloudinary_api_key,
+                    self.cloudinary_api_secret,
+                )
+        elif self.image_hosting == ImageHosting.IMGURL:
+            return imgurl_upload(img, self.imgurl_hosting_url, self.imgurl_api_key)
+        elif self.image_hosting == ImageHosting.TUCANG:
+            return tucang_upload(img, self.tucang_token)
+        elif self.image_hosting == ImageHosting.SMMS:
+            return smms_upload(img, self.smms_api_key)
+        elif self.image_hosting == ImageHosting.BYR:
+            return byr_upload(img, self.byr_authorization, self.byr_alternative_url)
+        return None
+
+    def _upload_screenshot(self, count: int, img: Path) -> Optional[ImageUploaded]:
+        img_url_file = img.resolve().parent.joinpath(
+            ".{}.{}".format(self.image_hosting.value, img.stem)
+        )
+        if img_url_file.is_file():
+            with open(img_url_file, "r") as f:
+                line = f.read().strip()
+                if len(line.split(" ")) > 1:
+                    img_url = ImageUploaded(line.split(" ")[0], line.split(" ")[1])
+                else:
+                    img_url = ImageUploaded(line)
+                logger.info(f"发现已上传的第{count + 1}张截图链接：{img_url}")
+            return img_url
+
+        try:
+            img_url = self._upload_image(img)
+        except Exception as e:
+            logger.warning(f"上传第{count + 1}张截图出错: {e}")
+            img_url = None
+        if img_url:
+            logger.info(f"第{count + 1}张截图地址：{img_url.url}")
+            with open(img_url_file, "w") as f:
+                if img_url.thumb:
+                    f.write(f"{img_url.url} {img_url.thumb}")
+                else:
+                    f.write(f"{img_url.url}")
+        else:
+            logger.info(f"第{count + 1}张截图上传失败，请自行上传：{img.resolve()}")
+        return img_url
+
+    def _request_ptgen(self, ptgen_url: str, url: str) -> Optional[dict]:
+        try:
+            req = network.get(ptgen_url, {"url": url}, timeout=self.ptgen_timeout)
+            res = req.json() if req.ok else {}
+        except (RequestException, ValueError) as e:
+            logger.warning(f"获取PTGen失败: {ptgen_url} {e}")
+            return None
+        if not req.ok:
+            logger.trace(req.content)
+            logger.warning(f"获取PTGen失败: HTTP {req.status_code}, reason: {req.reason}")
+            return None
+        if not res.get("success", False):
+            logger.trace(res)
+            logger.warning(f"获取PTGen失败: {res.get('error', 'Unknown error')}")
+            return None
+        return res
+
+    def _race_ptgen(self, ptgen_urls: List[str], url: str, delay: Optional[float]) -> Tuple[Optional[dict], str]:
+        # 依次请求各个PTGen，前一个失败或者超过delay秒未返回时请求下一个，返回最先成功的结果
+        executor = ThreadPoolExecutor(max_workers=len(ptgen_urls))
+        rest = list(ptgen_urls)
+        pending = {}
+        try:
+            while rest or pending:
+                if rest:
+                    ptgen_url = rest.pop(0)
+                    pending[executor.submit(self._request_ptgen, ptgen_url, url)] = ptgen_url
+                done, _ = wait(pending, timeout=delay if rest else None, return_when=FIRST_COMPLETED)
+                for future in done:
+                    ptgen_url = pending.pop(future)
+                    if future.result():
+                        return future.result(), ptgen_url
+            return None, ""
+        finally:
+            # 不等待仍未返回的请求，它们会在超时后自行结束；cancel_futures需要Python 3.9，这里手动取消
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def _fetch_ptgen(self, url: str) -> Tuple[Optional[dict], str]:
+        ptgen_urls = [u for u in (self.ptgen_url, self.second_ptgen_url) if u]
+        if self.ptgen_hedge:
+            rounds = [ptgen_urls] * (self.ptgen_retry + 1)
+        else:
+            # 先使用主PTGen重试，之后再使用备用PTGen重试
+            rounds = [ptgen_urls[:1]] * (self.ptgen_retry + 1) + [ptgen_urls[1:]] * self.ptgen_retry
+        for attempt, urls in enumerate(r for r in rounds if r):
+            if attempt:
+                backoff = random.uniform(0, min(PTGEN_BACKOFF_MAX, PTGEN_BACKOFF_BASE * 2 ** (attempt - 1)))
+                logger.info(f"{backoff:.1f}秒后重试获取PTGen...")
+                time.sleep(backoff)
+            ptgen, ptgen_url = self._race_ptgen(urls, url, self.ptgen_hedge_delay / 1000)
+            if ptgen:
+                return ptgen, ptgen_url
+        return None, ""
+
+    def _load_ptgen_cache(self, url: str) -> Optional[dict]:
+        # 返回缓存的PTGen结果，失败的结果为{"failed": True}，没有缓存或已过期时返回None
+        if not self.ptgen_cache_ttl or self.refresh_ptgen:
+            return None
+        store = self._artifact_store("ptgen")
+        key = ArtifactStore.make_key(normalize_url(url))
+        cached_dir = store.get(key)
+        if not cached_dir:
+            return None
+        try:
+            with open(cached_dir.joinpath("ptgen.json"), "r") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            store.remove([key])
+            return None
+        ttl = self.ptgen_negative_ttl * 60 if cached["failed"] else self.ptgen_cache_ttl * 3600
+        if time.time() - cached["fetched"] > ttl:
+            return None
+        return {"failed": True} if cached["failed"] else cached["ptgen"]
+
+    def _save_ptgen_cache(self, url: str, ptgen: Optional[dict]):
+        if not self.ptgen_cache_ttl:
+            return
+        store = self._artifact_store("ptgen")
+        key = ArtifactStore.make_key(normalize_url(url))
+        if store.get(key):
+            store.remove([key])
+        temp_dir = store.create(key)
+        with open(Path(temp_dir).joinpath("ptgen.json"), "w") as f:
+            json.dump({"fetched": time.time(), "failed": not ptgen, "ptgen": ptgen}, f, ensure_ascii=False)
+        store.commit(key, temp_dir, {"url": url})
+
+    def _get_cached_ptgen(self, url: str, ptgen_url: str = "") -> Tuple[Optional[dict], str]:
+        cached = self._load_ptgen_cache(url)
+        if cached is not None:
+            if cached.get("failed"):
+                logger.info(f"近期获取PTGen失败，跳过请求，可以使用--refresh-ptgen重新获取: {url}")
+                return None, ptgen_url
+            logger.info(f"使用缓存的PTGen: {url}")
+            return cached, ptgen_url
+        if ptgen_url:
+            ptgen = self._request_ptgen(ptgen_url, url)
+        else:
+            ptgen, ptgen_url = self._fetch_ptgen(url)
+        self._save_ptgen_cache(url, ptgen)
+        return ptgen, ptgen_url
+
+    def _get_ptgen(self) -> dict:
         self._imdb = {}
         ptgen_failed = {"format": "PTGen获取失败，请自行获取相关信息", "failed": True}
         logger.info(f"正在获取PTGen: {self.url}")
-        params = {"url": self.url}
-        req = requests.get(self.ptgen_url if not use_second else self.second_ptgen_url, params)
-        if not req.ok:
-            logger.trace(req.content)
-            logger.warning(f"获取PTGen失败: HTTP f{req.status_code}, reason: {req.reason}")
-            return ptgen_failed
-        if not req.json().get("success", False):
-            logger.trace(req.json())
-            logger.warning(f"获取PTGen失败: {req.json().get('error', 'Unknown error')}")
+        ptgen, ptgen_url = self._get_cached_ptgen(self.url)
+        if not ptgen:
             return ptgen_failed
 
         # 尝试获取IMDB描述
-        if req.json().get("site") != "imdb":
-            if req.json().get("imdb_link"):
-                imdb_params = {"url": req.json().get("imdb_link")}
-                imdb_req = requests.get(self.ptgen_url, imdb_params)
-                if imdb_req.ok and imdb_req.json().get("success"):
-                    self._imdb = imdb_req.json()
+        if ptgen.get("site") != "imdb":
+            if ptgen.get("imdb_link"):
+                imdb, _ = self._get_cached_ptgen(ptgen.get("imdb_link"), ptgen_url or self.ptgen_url)
+                self._imdb = imdb or {}
         else:
-            self._imdb = req.json()
-        logger.info(f"获取PTGen成功 {req.json().get('chinese_title', '')}")
-        return req.json()
+            self._imdb = ptgen
+        logger.info(f"获取PTGen成功 {ptgen.get('chinese_title', '')}")
+        return ptgen
+
+    def _artifact_store(self, namespace: str) -> ArtifactStore:
+        return ArtifactStore(namespace, self.cache_size * 1024 * 1024)
 
     def _get_bdinfo(self) -> str:
         if not self.scan_bdinfo:
@@ -649,20 +1005,18 @@ class Base(ABC, TorrnetBase, metaclass=PluginRegister):
             return "[BDINFO HERE]"
         else:
             logger.info("目标为BDMV，正在扫描BDInfo...")
-            for f in Path(tempfile.gettempdir()).glob("Differential.bdinfo.*"):
-                if f.is_dir() and self.folder.name in f.name:
-                    if list(f.glob("*.txt")):
-                        temp_dir = f.absolute()
-                        logger.info(
-                            "发现已生成的BDInfo，跳过扫描BDInfo...".format(self.screenshot_count)
-                        )
-                        break
+            bdmvs = list(self.folder.glob("**/BDMV"))
+            store = self._artifact_store("bdinfo")
+            key = ArtifactStore.make_key(
+                get_file_fingerprint(self._main_file),
+                sorted(str(f.relative_to(self.folder)) for f in bdmvs),
+            )
+            temp_dir = store.get(key)
+            if temp_dir and list(temp_dir.glob("*.txt")):
+                logger.info("发现已生成的BDInfo，跳过扫描BDInfo...")
             else:
-                temp_dir = temp_dir = tempfile.mkdtemp(
-                    prefix="Differential.bdinfo.{}.".format(version),
-                    suffix=self.folder.name,
-                )
-                for f in self.folder.glob("**/BDMV"):
+                temp_dir = store.create(key)
+                for f in bdmvs:
                     logger.info(f"正在扫描{f.parent}...")
                     if platform.system() == "Windows":
                         execute_with_output(
@@ -680,6 +1034,10 @@ class Base(ABC, TorrnetBase, metaclass=PluginRegister):
                             f'"{f.parent}" "{temp_dir}"',
                             abort=True,
                         )
+                if list(Path(temp_dir).glob("*.txt")):
+                    temp_dir = store.commit(key, temp_dir, {"folder": self.folder.name})
+                else:
+                    store.discard(temp_dir)
             bdinfos = []
             for info in sorted(Path(temp_dir).glob("*.txt")):
                 with info.open("r") as f:
@@ -695,7 +1053,6 @@ class Base(ABC, TorrnetBase, metaclass=PluginRegister):
                     )
                     if m:
                         bdinfos.append(m.groups()[0])
-            # shutil.rmtree(temp_dir, ignore_errors=True)
             return "\n\n".join(bdinfos)
 
     def _find_mediainfo(self) -> MediaInfo:
@@ -762,47 +1119,179 @@ class Base(ABC, TorrnetBase, metaclass=PluginRegister):
             with open(self.folder.joinpath(f"{self.folder.name}.nfo"), "wb") as f:
                 f.write(self.media_info.encode())
 
+    def _encode_screenshot(self, image: Image.Image, screenshot_path: str):
+        # 直接按最终的压缩参数编码，只写一次文件，不需要再读回重新压缩
+        data, before = encode_image(
+            image,
+            self.screenshot_format,
+            self.jpeg_quality,
+            self.png_compress_level,
+            self.png_strategy,
+            self.png_palette,
+        )
+        with open(screenshot_path, "wb") as f:
+            f.write(data)
+        after = len(data)
+        logger.info(f"{Path(screenshot_path).name}: {before} -> {after} 字节，节省{before - after}字节")
+
+    def _make_screenshot(self, idx: int, t: int, resolution: str, temp_dir: str) -> str:
+        logger.info(f"正在生成第{idx}张截图...")
+        screenshot_path = f"{temp_dir}/{get_screenshot_name(self._main_file, idx, self.screenshot_format)}"
+        if self.optimize_screenshot:
+            image = seek_frame(self._main_file, t, resolution)
+            if image is not None:
+                self._encode_screenshot(image, screenshot_path)
+        else:
+            seek_screenshot(self._main_file, t, resolution, screenshot_path)
+        self._screenshot_done(idx, screenshot_path)
+        return screenshot_path
+
+    def _screenshot_done(self, idx: int, screenshot_path: str):
+        # 截图写入后立刻交给流水线的下一阶段，队列满时会在这里等待
+        if self._screenshot_stage is not None and Path(screenshot_path).is_file():
+            self._screenshot_stage.put(idx, screenshot_path)
+
+    def _single_pass_screenshots(
+        self, executor: ThreadPoolExecutor, timestamps: List[int], resolution: str, temp_dir: str
+    ) -> List[str]:
+        if not self.optimize_screenshot:
+            return single_pass_screenshots(
+                self._main_file, timestamps, resolution, temp_dir, self.screenshot_format
+            )
+        screenshots = []
+        futures = []
+        for idx, image in enumerate(single_pass_frames(self._main_file, timestamps, resolution), 1):
+            screenshot_path = f"{temp_dir}/{get_screenshot_name(self._main_file, idx, self.screenshot_format)}"
+            futures.append(executor.submit(self._encode_screenshot, image, screenshot_path))
+            screenshots.append(screenshot_path)
+        for future in futures:
+            future.result()
+        if len(screenshots) < len(timestamps):
+            # 多个时间点落在同一个关键帧上时截图数量会不足，无法和时间点一一对应
+            remove_screenshots(screenshots)
+            return []
+        return screenshots
+
+    def _pipeline_uploads(self) -> bool:
+        # HDB和imgbox需要一次性上传全部截图，无法和截图同时进行
+        return self.image_hosting not in (ImageHosting.HDB, ImageHosting.IMGBOX)
+
+    def _generate_screenshots(self, temp_dir: str, resolution: str, duration) -> List[str]:
+        # 压缩截图时截图线程已经直接编码出最终的文件，不需要单独的压缩阶段
+        if not self._pipeline_uploads():
+            return self._extract_screenshots(temp_dir, resolution, duration)
+
+        # 截图和上传组成流水线，每张截图生成后立刻上传
+        self._check_image_hosting()
+        upload_stage = Stage(
+            lambda idx, screenshot: self._upload_screenshot(idx - 1, Path(screenshot)),
+            self._upload_workers(),
+        )
+        self._screenshot_stage = upload_stage
+        try:
+            screenshots = self._extract_screenshots(temp_dir, resolution, duration)
+        finally:
+            stage, self._screenshot_stage = self._screenshot_stage, None
+            stage.close()
+        results = upload_stage.results
+        self._uploaded_screenshots = [results[i] for i in sorted(results) if results[i]]
+        return screenshots
+
+    def _optimize_screenshot(self, screenshot: str) -> str:
+        # 只用于不是由原始帧编码的图片，例如ffmpeg直接生成的拼图
+        try:
+            before, after = optimize_image(
+                screenshot, self.png_compress_level, self.png_strategy, self.png_palette
+            )
+            logger.info(f"{Path(screenshot).name}: {before} -> {after} 字节，节省{before - after}字节")
+        except Exception as e:
+            logger.warning(f"压缩截图{Path(screenshot).name}失败: {e}")
+        return screenshot
+
+    def _extract_screenshots(self, temp_dir: str, resolution: str, duration) -> List[str]:
+        timestamps = get_screenshot_timestamps(duration, self.screenshot_count)
+        if self.keyframe_index:
+            keyframes = get_keyframe_index(self._main_file, self.cache_size * 1024 * 1024)
+            if keyframes:
+                timestamps = snap_to_keyframes(timestamps, keyframes)
+        if self.screenshot_candidates:
+            timestamps = select_screenshot_timestamps(
+                self._main_file,
+                timestamps,
+                duration,
+                self.screenshot_candidates,
+                self.screenshot_workers,
+            )
+        mode = self.screenshot_mode
+        if mode == ScreenshotMode.AUTO:
+            mode = choose_screenshot_mode(self._main_file, duration, self.screenshot_count)
+        with ThreadPoolExecutor(max_workers=self.screenshot_workers) as executor:
+            if mode == ScreenshotMode.SINGLE:
+                logger.info(f"正在通过单个ffmpeg进程生成{self.screenshot_count}张截图...")
+                screenshots = self._single_pass_screenshots(
+                    executor, timestamps, resolution, temp_dir
+                )
+                if screenshots:
+                    # 单进程截图只有全部完成后才能确认截图有效
+                    for idx, screenshot in enumerate(screenshots, 1):
+                        self._screenshot_done(idx, screenshot)
+                    return screenshots
+                logger.info("单进程截图失败，改为逐张生成截图...")
+            # 每张截图的ffmpeg进程互相独立，可以并行执行
+            return list(
+                executor.map(
+                    self._make_screenshot,
+                    range(1, self.screenshot_count + 1),
+                    timestamps,
+                    repeat(resolution),
+                    repeat(temp_dir),
+                )
+            )
+
+    def _screenshot_cache_key(self, resolution: str, duration) -> str:
+        return ArtifactStore.make_key(
+            get_file_fingerprint(self._main_file),
+            get_screenshot_timestamps(duration, self.screenshot_count),
+            resolution,
+            {
+                "format": self.screenshot_format,
+                "optimize": self.optimize_screenshot,
+                "png": [self.png_compress_level, self.png_strategy, self.png_palette],
+                "jpeg_quality": self.jpeg_quality,
+                "keyframe_index": self.keyframe_index,
+                "candidates": self.screenshot_candidates,
+            },
+        )
+
     def _make_screenshots(self) -> Optional[str]:
+        if self.screenshot_count <= 0:
+            return None
         resolution = get_resolution(self._main_file, self._mediainfo)
         duration = get_duration(self._mediainfo)
         if resolution is None or duration is None:
             return None
 
-        temp_dir = None
         # 查找已有的截图
-        for f in Path(tempfile.gettempdir()).glob(
-            "Differential.screenshots.{}.*".format(self.image_hosting.value)
-        ):
-            if f.is_dir() and self.folder.name in f.name:
-                if 0 < self.screenshot_count == len(list(f.glob("*.png"))):
-                    temp_dir = f.absolute()
-                    logger.info("发现已生成的{}张截图，跳过截图...".format(self.screenshot_count))
-                    break
-        else:
-            temp_dir = tempfile.mkdtemp(
-                prefix="Differential.screenshots.{}.{}.".format(
-                    self.image_hosting.value, version
-                ),
-                suffix=self.folder.name,
+        store = self._artifact_store("screenshots")
+        key = self._screenshot_cache_key(resolution, duration)
+        cached_dir = store.get(key)
+        if cached_dir:
+            logger.info("发现已生成的{}张截图，跳过截图...".format(self.screenshot_count))
+            return str(cached_dir)
+
+        temp_dir = store.create(key)
+        # 生成截图
+        screenshots = self._generate_screenshots(temp_dir, resolution, duration)
+        if not all(Path(s).is_file() for s in screenshots):
+            logger.warning("部分截图生成失败，本次截图不会被缓存")
+            return temp_dir
+        return str(
+            store.commit(
+                key,
+                temp_dir,
+                {"file": self._main_file.name, "count": self.screenshot_count},
             )
-            # 生成截图
-            for i in range(1, self.screenshot_count + 1):
-                logger.info(f"正在生成第{i}张截图...")
-                t = int(i * duration / (self.screenshot_count + 1))
-                screenshot_path = (
-                    f"{temp_dir}/{self._main_file.stem}.thumb_{str(i).zfill(2)}.png"
-                )
-                execute(
-                    "ffmpeg",
-                    (
-                        f'-y -ss {t}ms -skip_frame nokey -i "{self._main_file.absolute()}" '
-                        f'-s {resolution} -vsync 0 -vframes 1 -c:v png "{screenshot_path}"'
-                    ),
-                )
-                if self.optimize_screenshot:
-                    image = Image.open(screenshot_path)
-                    image.save(f"{screenshot_path}", format="PNG", optimized=True)
-        return temp_dir
+        )
 
     def _get_screenshots(self) -> list:
         if self._main_file is None:
@@ -823,33 +1312,57 @@ class Base(ABC, TorrnetBase, metaclass=PluginRegister):
         if temp_dir is None or not Path(temp_dir).exists():
             return []
 
-        # 上传截图
-        screenshots = self.upload_screenshots(temp_dir)
+        # 上传截图，如果截图时已经通过流水线上传，直接使用上传结果
+        if self._uploaded_screenshots is not None:
+            screenshots, self._uploaded_screenshots = self._uploaded_screenshots, None
+        else:
+            screenshots = self.upload_screenshots(temp_dir)
         logger.trace(f"Collected screenshots: {screenshots}")
 
-        # 删除临时文件夹
-        # shutil.rmtree(temp_dir, ignore_errors=True)
-
         return screenshots
 
-    def _prepare(self):
-        ptgen_retry = 2 * self.ptgen_retry
-        self._ptgen = self._get_ptgen()
-        while self._ptgen.get("failed") and ptgen_retry > 0:
-            self._ptgen = self._get_ptgen(ptgen_retry <= self.ptgen_retry)
-            ptgen_retry -= 1
-        self._mediainfo = self._find_mediainfo()
+    def _torrent_sites(self) -> List[TorrentSite]:
+        # 当前站点的种子总是会生成，torrent_sites中前缀相同的站点会覆盖它
+        sites = parse_torrent_sites(self.torrent_sites or "")
+        if not any(site.prefix == self.__class__.__name__ for site in sites):
+            sites.insert(0, TorrentSite(self.__class__.__name__, self.announce_url))
+        return sites
+
+    def _make_torrent(self):
+        make_torrents(
+            self.folder,
+            self._torrent_sites(),
+            self.reuse_torrent,
+            self.from_torrent,
+            self.torrent_workers,
+            self.torrent_read_size * 1024 * 1024,
+            self.torrent_backend,
+            self.torrent_verify_samples,
+            self.torrent_dirs,
+            self.torrent_align_files,
+            self.torrent_piece_size * 1024,
+            self.torrent_hybrid,
+        )
+
+    def _prepare_stages(self, scheduler: StageScheduler):
+        # PTGen只依赖网络，会和MediaInfo、截图、制种同时进行
+        scheduler.add("ptgen", self._get_ptgen, pool=StagePool.NETWORK, output="_ptgen")
+        scheduler.add("mediainfo", self._find_mediainfo, pool=StagePool.IO, output="_mediainfo")
         if self.generate_nfo:
-            self._generate_nfo()
-        self._screenshots = self._get_screenshots()
+            scheduler.add("nfo", self._generate_nfo, requires=["mediainfo"], pool=StagePool.IO)
+        # 截图上传已经在截图阶段内部和截图同时进行
+        scheduler.add(
+            "screenshots", self._get_screenshots, requires=["mediainfo"], pool=StagePool.CPU, output="_screenshots"
+        )
         if self.make_torrent:
-            make_torrent(
-                self.folder,
-                self.announce_url,
-                self.__class__.__name__,
-                self.reuse_torrent,
-                self.from_torrent,
-            )
+            # 开启create_folder时_find_mediainfo会移动文件，需要在其之后制种；NFO会写入种子的目录，需要先生成
+            requires = ["mediainfo", "nfo"] if self.generate_nfo else ["mediainfo"]
+            scheduler.add("torrent", self._make_torrent, requires=requires, pool=StagePool.IO)
+
+    def _prepare(self):
+        scheduler = StageScheduler(self)
+        self._prepare_stages(scheduler)
+        scheduler.run()
 
     @property
     def parsed_encoder_log(self):
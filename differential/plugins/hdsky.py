@@ -1,26 +1,16 @@
 import re
 import os
 import cn2an
-import requests
 import argparse
-import tempfile
-from PIL import Image
-from io import BytesIO
 from pathlib import Path
 from xpinyin import Pinyin
-from typing import Optional
 from loguru import logger
 from pymediainfo import MediaInfo
-import mozjpeg_lossless_optimization
 from configparser import ConfigParser
-from differential.utils.binary import execute
+from differential.utils import network
 from differential.plugins.nexusphp import NexusPHP
+from differential.utils.scheduler import StageScheduler, StagePool
 from differential.plugins.bbdown import bili_download
-from differential.utils.torrent import make_torrent
-from differential.utils.mediainfo import (
-    get_resolution,
-    get_duration,
-)
 
 cleaned_re = r'\s+'
 chinese_re = r'[\u4e00-\u9fa5]'
@@ -55,6 +45,7 @@ def process_aka_name(aka_name):
 
 
 class HDSky(NexusPHP):
+    screenshot_format = "jpg"
 
     @classmethod
     def get_aliases(cls):
@@ -116,34 +107,33 @@ class HDSky(NexusPHP):
         self.bilibili_save_path = bilibili_save_path
         self.custom_screenshot_path = custom_screenshot_path
         self.tv_unfinished = tv_unfinished
+        if tv_unfinished in enable_args and not self.torrent_align_files:
+            # 对齐分块会在种子中插入填充文件，需要用户自行开启
+            logger.info("连载的剧集每次更新都要重新制种，可以开启torrent_align_files，之后只需要计算新增文件的哈希")
         self.platform = platform
         self.config_path = "\\".join(kwargs["config"].split("\\")[:-1])
         self.custom_type = custom_type
 
-    def _prepare(self):
-        ptgen_retry = 2 * self.ptgen_retry
-        self._ptgen = self._get_ptgen()
-        while self._ptgen.get("failed") and ptgen_retry > 0:
-            self._ptgen = self._get_ptgen(ptgen_retry <= self.ptgen_retry)
-            ptgen_retry -= 1
+    def _prepare_stages(self, scheduler: StageScheduler):
+        super()._prepare_stages(scheduler)
         if self.bilibili_url and self.bilibili_save_path:
-            self.bili_temp_download()
-            self._mediainfo = self._find_mediainfo()
-            self.bili_auto_download()
-        self._mediainfo = self._find_mediainfo()
-        if self.generate_nfo:
-            self._generate_nfo()
-        self._screenshots = self._get_screenshots()
-        if self.make_torrent:
-            make_torrent(
-                self.folder,
-                self.announce_url,
-                self.__class__.__name__,
-                self.reuse_torrent,
-                self.from_torrent,
+            # B站视频以豆瓣ID命名，需要先等待PTGen，下载完成后才能获取MediaInfo
+            scheduler.add("bilibili", self._bili_download, requires=["ptgen"], pool=StagePool.NETWORK)
+            scheduler.require("mediainfo", "bilibili")
+            scheduler.add(
+                "bilibili_cleanup",
+                self._bili_cleanup,
+                requires=[n for n in ("nfo", "screenshots", "torrent") if n in scheduler.stages],
+                pool=StagePool.IO,
             )
-        if self.bilibili_url and self.bilibili_save_path:
-            os.remove(os.path.join(self.bilibili_save_path, "temp", f"{self.douban_id}.mp4"))
+
+    def _bili_download(self):
+        self.bili_temp_download()
+        self._mediainfo = self._find_mediainfo()
+        self.bili_auto_download()
+
+    def _bili_cleanup(self):
+        os.remove(os.path.join(self.bilibili_save_path, "temp", f"{self.douban_id}.mp4"))
 
     @property
     def category(self):
@@ -243,7 +233,7 @@ class HDSky(NexusPHP):
             "url": self.douban_url
         }
         try:
-            response = requests.get(url, params=params)
+            response = network.get(url, params=params)
             if response.ok:
                 return response.json().get("data", {}).get("format", "")
             else:
@@ -252,100 +242,6 @@ class HDSky(NexusPHP):
             logger.warning(f"获取iyuu ptgen 失败: {e}")
             return ""
 
-    def _make_screenshots(self) -> Optional[str]:
-        # TODO https://nicelee.top/blog/2021/01/06/python-opencv-video-frame/
-        resolution = get_resolution(self._main_file, self._mediainfo)
-        duration = get_duration(self._mediainfo)
-        if resolution is None or duration is None:
-            return None
-
-        temp_dir = None
-        # 查找已有的截图
-        if self.screenshot_path:
-            for f in Path(self.screenshot_path).glob(
-                    self.image_hosting.value
-            ):
-                if f.is_dir() and self.folder.name in f.name:
-                    if 0 < self.screenshot_count == len(list(f.glob("*.png"))):
-                        temp_dir = f.absolute()
-                        logger.info("发现已生成的{}张截图，跳过截图...".format(self.screenshot_count))
-                        break
-            else:
-                os.mkdir(f"{self.screenshot_path}/{self.folder.name}")
-                # 生成截图
-                for i in range(1, self.screenshot_count + 1):
-                    logger.info(f"正在生成第{i}张截图...")
-                    t = int(i * duration / (self.screenshot_count + 1))
-                    screenshot_path = (
-                        f"{temp_dir}/{self._main_file.stem}.thumb_{str(i).zfill(2)}.png"
-                    )
-                    execute(
-                        "ffmpeg",
-                        (
-                            f'-y -ss {t}ms -skip_frame nokey -i "{self._main_file.absolute()}" '
-                            f'-s {resolution} -vsync 0 -vframes 1 -c:v png "{screenshot_path}"'
-                        ),
-                    )
-                    if self.optimize_screenshot:
-                        image = Image.open(screenshot_path)
-                        jpeg_io = BytesIO()
-                        image.convert("RGB").save(jpeg_io, format="JPEG")
-                        jpeg_io.seek(0)
-                        jpeg_bytes = jpeg_io.read()
-                        optimized_jpeg_bytes = mozjpeg_lossless_optimization.optimize(jpeg_bytes)
-                        # w, h = image.size
-                        # new_width = 1920
-                        # new_height = int(1920 * h / w)
-                        # resize_img = image.resize((new_width, new_height))
-                        # image.save(screenshot_path, format="PNG", optimized=True)
-                        with open(screenshot_path, "wb") as f:
-                            f.write(optimized_jpeg_bytes)
-        else:
-            for f in Path(tempfile.gettempdir()).glob(
-                    "Differential.screenshots.{}.*".format(self.image_hosting.value)
-            ):
-                if f.is_dir() and self.folder.name in f.name:
-                    if 0 < self.screenshot_count == len(list(f.glob("*.png"))):
-                        temp_dir = f.absolute()
-                        logger.info("发现已生成的{}张截图，跳过截图...".format(self.screenshot_count))
-                        break
-            else:
-                temp_dir = tempfile.mkdtemp(
-                    prefix="Differential.screenshots.{}.".format(
-                        self.image_hosting.value
-                    ),
-                    suffix=self.folder.name,
-                )
-                # 生成截图
-                for i in range(1, self.screenshot_count + 1):
-                    logger.info(f"正在生成第{i}张截图...")
-                    t = int(i * duration / (self.screenshot_count + 1))
-                    screenshot_path = (
-                        f"{temp_dir}/{self._main_file.stem}.thumb_{str(i).zfill(2)}.png"
-                    )
-                    execute(
-                        "ffmpeg",
-                        (
-                            f'-y -ss {t}ms -skip_frame nokey -i "{self._main_file.absolute()}" '
-                            f'-s {resolution} -vsync 0 -vframes 1 -c:v png "{screenshot_path}"'
-                        ),
-                    )
-                    if self.optimize_screenshot:
-                        image = Image.open(screenshot_path)
-                        jpeg_io = BytesIO()
-                        image.convert("RGB").save(jpeg_io, format="JPEG")
-                        jpeg_io.seek(0)
-                        jpeg_bytes = jpeg_io.read()
-                        optimized_jpeg_bytes = mozjpeg_lossless_optimization.optimize(jpeg_bytes)
-                        # w, h = image.size
-                        # new_width = 1920
-                        # new_height = int(1920 * h / w)
-                        # resize_img = image.resize((new_width, new_height))
-                        # image.save(screenshot_path, format="PNG", optimized=True)
-                        with open(screenshot_path, "wb") as f:
-                            f.write(optimized_jpeg_bytes)
-        return temp_dir
-
     @property
     def description(self):
         if self.generate_name:
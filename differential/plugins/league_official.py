@@ -1,13 +1,13 @@
 import string
 import argparse
-import tempfile
 from pathlib import Path
 from typing import Optional
 
-from PIL import Image
 from loguru import logger
 
 from differential.plugins.lemonhd import LemonHD
+from differential.utils.cache import ArtifactStore
+from differential.utils.screenshot import make_contact_sheet
 from differential.utils.mediainfo import get_track_attr, get_track_attrs
 
 
@@ -48,37 +48,67 @@ class LeagueOfficial(LemonHD):
         parser.add_argument('--uploader', type=str, help="发布者者名字，默认Anonymous", default=argparse.SUPPRESS)
         parser.add_argument('--team', type=str, help="官组名，LeagueTV/LeagueWeb/LeagueNF等等", default=argparse.SUPPRESS)
         parser.add_argument('--combine-screenshots', type=bool, help='是否合并所有截图为一张图，默认开启', default=argparse.SUPPRESS)
+        parser.add_argument('--combine-columns', type=int, help='合并截图时每行的截图数，默认2', default=argparse.SUPPRESS)
+        parser.add_argument('--combine-width', type=int, help='合并截图时每张截图缩放后的宽度，默认为0，即不缩放', default=argparse.SUPPRESS)
+        parser.add_argument('--combine-format', type=str, choices=['png', 'jpg', 'webp'], help='合并后图片的格式，默认png', default=argparse.SUPPRESS)
         return parser
 
-    def __init__(self, source_name: str, team: str, uploader: str = "Anonymous", combine_screenshots: bool = True, **kwargs):
+    def __init__(
+        self,
+        source_name: str,
+        team: str,
+        uploader: str = "Anonymous",
+        combine_screenshots: bool = True,
+        combine_columns: int = 2,
+        combine_width: int = 0,
+        combine_format: str = "png",
+        **kwargs,
+    ):
         super().__init__(**kwargs)
         self.team = team
         self.uploader = uploader
         self.source_name = source_name
         self.combine_screenshots = combine_screenshots
+        self.combine_columns = combine_columns
+        self.combine_width = combine_width
+        self.combine_format = combine_format
+
+    def _pipeline_uploads(self) -> bool:
+        # 需要合并后再上传
+        return not self.combine_screenshots and super()._pipeline_uploads()
 
     def _make_screenshots(self) -> Optional[str]:
         screenshots_dir = super()._make_screenshots()
-        if not self.combine_screenshots:
+        if not self.combine_screenshots or screenshots_dir is None:
             return screenshots_dir
 
+        store = self._artifact_store("combined_screenshots")
+        key = ArtifactStore.make_key(
+            Path(screenshots_dir).name, self.combine_columns, self.combine_width, self.combine_format
+        )
+        cached_dir = store.get(key)
+        if cached_dir:
+            logger.info("发现已合并的截图，跳过合并...")
+            return str(cached_dir)
+
         logger.info("正在合并图片...")
-        images = [Image.open(i) for i in sorted(Path(screenshots_dir).glob("*.png"))]
-
-        width, height = images[0].size
-        new_width = 2 * width
-        new_height = (self.screenshot_count // 2 + self.screenshot_count % 2) * height
-
-        new_im = Image.new('RGBA', (new_width, new_height))
-        for idx, im in enumerate(images):
-            x = (idx % 2) * width
-            y = (idx // 2) * height
-            new_im.paste(im, (x, y))
-
-        temp_dir = tempfile.mkdtemp()
-        screenshot_path = f'{temp_dir}/{self._main_file.stem}.thumb.png'
-        new_im.save(screenshot_path, format='png')
-        return temp_dir
+        temp_dir = store.create(key)
+        screenshot_path = f'{temp_dir}/{self._main_file.stem}.thumb.{self.combine_format}'
+        if not make_contact_sheet(
+            self._main_file,
+            screenshots_dir,
+            self.screenshot_count,
+            screenshot_path,
+            self.combine_columns,
+            self.combine_width,
+            self.screenshot_format,
+        ):
+            logger.warning("合并图片失败，将上传未合并的截图")
+            store.discard(temp_dir)
+            return screenshots_dir
+        if self.optimize_screenshot:
+            self._optimize_screenshot(screenshot_path)
+        return str(store.commit(key, temp_dir, {"file": self._main_file.name}))
 
     @property
     def subtitle(self):
@@ -0,0 +1,113 @@
+import mmap
+from contextlib import contextmanager
+from typing import Dict, Iterator, Tuple
+
+import bencodepy
+
+
+class BencodeError(ValueError):
+    pass
+
+
+def _read_int(buf, pos: int, end: bytes) -> Tuple[int, int]:
+    # 返回整数值和结束符之后的位置
+    stop = buf.find(end, pos)
+    if stop < 0:
+        raise BencodeError(f"位置{pos}的整数没有结束符")
+    try:
+        return int(buf[pos:stop]), stop + 1
+    except ValueError:
+        raise BencodeError(f"位置{pos}的整数无效")
+
+
+_DIGITS = frozenset(b"0123456789")
+
+
+def skip_value(buf, pos: int) -> int:
+    """返回从pos开始的一个值结束后的位置，字符串直接按长度跳过，不会复制其内容"""
+    # 用栈代替递归，嵌套很深的文件列表也不会超过递归深度；按下标取单个字节，避免切片的开销
+    size = len(buf)
+    depth = 0
+    while True:
+        if pos >= size:
+            raise BencodeError("数据不完整")
+        c = buf[pos]
+        if c in _DIGITS:
+            length, pos = _read_int(buf, pos, b":")
+            pos += length
+            if pos > size:
+                raise BencodeError("字符串长度超出数据范围")
+        elif c == 0x69:  # i
+            _, pos = _read_int(buf, pos + 1, b"e")
+        elif c == 0x6C or c == 0x64:  # l d
+            depth += 1
+            pos += 1
+            continue
+        elif c == 0x65:  # e
+            if depth == 0:
+                raise BencodeError(f"位置{pos}有多余的结束符")
+            depth -= 1
+            pos += 1
+        else:
+            raise BencodeError(f"位置{pos}的值类型无效：{bytes([c])!r}")
+        if depth == 0:
+            return pos
+
+
+def dict_items(buf, pos: int) -> Iterator[Tuple[bytes, int, int]]:
+    """依次返回pos处字典的每个键，以及对应的值在buf中的起止位置"""
+    if buf[pos:pos + 1] != b"d":
+        raise BencodeError(f"位置{pos}不是字典")
+    pos += 1
+    while buf[pos:pos + 1] != b"e":
+        if not buf[pos:pos + 1].isdigit():
+            raise BencodeError(f"位置{pos}的字典键无效")
+        length, pos = _read_int(buf, pos, b":")
+        key = bytes(buf[pos:pos + length])
+        start = pos + length
+        end = skip_value(buf, start)
+        yield key, start, end
+        pos = end
+
+
+def dict_ranges(buf, pos: int = 0) -> Dict[bytes, Tuple[int, int]]:
+    return {key: (start, end) for key, start, end in dict_items(buf, pos)}
+
+
+def find_key(buf, pos: int, key: bytes) -> int:
+    """返回pos处字典中key对应的值的起始位置，只跳过它之前的值"""
+    if buf[pos:pos + 1] != b"d":
+        raise BencodeError(f"位置{pos}不是字典")
+    pos += 1
+    while buf[pos:pos + 1] != b"e":
+        if not buf[pos:pos + 1].isdigit():
+            raise BencodeError(f"位置{pos}的字典键无效")
+        length, pos = _read_int(buf, pos, b":")
+        current = bytes(buf[pos:pos + length])
+        pos += length
+        if current == key:
+            return pos
+        pos = skip_value(buf, pos)
+    raise BencodeError(f"缺少{key.decode(errors='replace')}字段")
+
+
+def decode_range(buf, span: Tuple[int, int]):
+    return bencodepy.decode(bytes(buf[span[0]:span[1]]))
+
+
+@contextmanager
+def map_file(path):
+    # 只读映射整个文件，种子再大也不需要一次读入内存
+    with open(path, "rb") as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise BencodeError(f"文件为空：{path}")
+    try:
+        yield buf
+    finally:
+        buf.close()
+
+
+def encode_key(key: bytes) -> bytes:
+    return str(len(key)).encode() + b":" + key
@@ -5,7 +5,7 @@ import shutil
 import platform
 import subprocess
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Tuple
 
 from loguru import logger
 
@@ -90,6 +90,21 @@ def execute(binary_name: str, args: str, abort: bool = False) -> str:
     return ret
 
 
+def execute_raw(binary_name: str, args: str, abort: bool = False) -> Tuple[bytes, str]:
+    cmd = build_cmd(binary_name, args, abort)
+    proc = subprocess.run(
+            cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stderr = proc.stderr.decode(errors="ignore")
+    if proc.returncode != 0:
+        logger.warning(f"{binary_name} exit with return code {proc.returncode}:\n{stderr}")
+    return proc.stdout, stderr
+
+
+def open_process(binary_name: str, args: str, abort: bool = False) -> subprocess.Popen:
+    cmd = build_cmd(binary_name, args, abort)
+    return subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+
 def ffmpeg(path: Path, extra_args: str = "") -> str:
     return execute("ffmpeg", f'-i "{path.absolute()}" {extra_args}')
 
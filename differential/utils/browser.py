@@ -1,7 +1,7 @@
-import requests
 import webbrowser
 
 from loguru import logger
+from differential.utils import network
 from differential.constants import URL_SHORTENER_PATH
 
 
@@ -12,7 +12,7 @@ def b4gs_short(link: str):
         "password": "s",
         "url": link,
     }
-    req = requests.post(f"{URL_SHORTENER_PATH}", json=data)
+    req = network.post(f"{URL_SHORTENER_PATH}", json=data)
     if req.ok:
         return f"{URL_SHORTENER_PATH}/{req.json().get('key')}"
     return link
@@ -22,7 +22,7 @@ def l2gs_short(link: str):
     data = {
         "url": link,
     }
-    req = requests.post(f"{URL_SHORTENER_PATH}/create", json=data)
+    req = network.post(f"{URL_SHORTENER_PATH}/create", json=data)
     if req.ok:
         return req.json().get("link")
     return link
@@ -0,0 +1,256 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import platform
+import tempfile
+import threading
+from pathlib import Path
+from typing import Optional, List, Dict, Tuple, Union
+
+from loguru import logger
+
+# 计算文件指纹时读取的头、中、尾片段大小
+FINGERPRINT_SAMPLE_SIZE = 1024 * 1024
+
+
+def get_cache_dir(name: str = "") -> Path:
+    path = os.environ.get("DIFFERENTIAL_CACHE_DIR")
+    if path:
+        cache_dir = Path(path)
+    elif platform.system() == "Windows":
+        cache_dir = Path(os.environ.get("LOCALAPPDATA", Path.home())).joinpath("Differential", "cache")
+    else:
+        cache_dir = Path(os.environ.get("XDG_CACHE_HOME", Path.home().joinpath(".cache"))).joinpath("differential")
+    if name:
+        cache_dir = cache_dir.joinpath(name)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+
+def get_file_fingerprint(path: Path) -> str:
+    # 使用文件大小和头、中、尾三段内容作为文件的标识，与文件路径和修改时间无关
+    size = os.stat(path).st_size
+    sha1 = hashlib.sha1(str(size).encode())
+    with open(path, "rb") as f:
+        for offset in (0, max(0, size // 2 - FINGERPRINT_SAMPLE_SIZE // 2), max(0, size - FINGERPRINT_SAMPLE_SIZE)):
+            f.seek(offset)
+            sha1.update(f.read(FINGERPRINT_SAMPLE_SIZE))
+    return sha1.hexdigest()
+
+
+# 截图、PTGen、关键帧等缓存可能在不同线程中同时提交，index的读取、修改和写入需要互斥
+_index_lock = threading.RLock()
+
+# 生成失败或者中断后遗留的临时目录，超过该时间后会在清理时被删除
+STALE_TEMP_SECONDS = 24 * 60 * 60
+
+
+def get_dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.glob("**/*") if f.is_file())
+
+
+def format_size(size: int) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+
+class ArtifactStore:
+    """按内容寻址的缓存目录，每个key对应一个子目录，index.json记录各个key的信息"""
+
+    def __init__(self, namespace: str, max_size: int = 0):
+        self.namespace = namespace
+        self.max_size = max_size
+        self.root = get_cache_dir(namespace)
+        self.index_file = self.root.joinpath("index.json")
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+    def load_index(self) -> dict:
+        if not self.index_file.is_file():
+            return {}
+        try:
+            with open(self.index_file, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_index(self, index: dict):
+        temp_file = self.index_file.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temp_file, "w") as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+        os.replace(temp_file, self.index_file)
+
+    def get(self, key: str) -> Optional[Path]:
+        path = self.root.joinpath(key)
+        if not path.is_dir():
+            return None
+        with _index_lock:
+            index = self.load_index()
+            if key in index:
+                index[key]["accessed"] = time.time()
+                self.save_index(index)
+        return path
+
+    def create(self, key: str) -> str:
+        # 先在临时目录中生成，完成后再通过commit移动到key对应的目录
+        return tempfile.mkdtemp(prefix=f"{key}.", suffix=".tmp", dir=self.root)
+
+    def commit(self, key: str, temp_dir: str, info: dict = None) -> Path:
+        path = self.root.joinpath(key)
+        if path.is_dir():
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        else:
+            os.replace(temp_dir, path)
+        size = get_dir_size(path)
+        with _index_lock:
+            index = self.load_index()
+            now = time.time()
+            index[key] = {**(info or {}), "size": size, "created": now, "accessed": now}
+            self.save_index(index)
+        if self.max_size:
+            prune_cache(self.max_size, keep=(self.namespace, key))
+        return path
+
+    @staticmethod
+    def discard(temp_dir: str):
+        # 生成失败时删除create得到的临时目录，不必等到过期后清理
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def entries(self) -> dict:
+        # 以目录为准，补全或者丢弃index中的记录
+        index = self.load_index()
+        entries = {}
+        for path in self.root.iterdir():
+            if not path.is_dir() or path.suffix == ".tmp":
+                continue
+            entry = index.get(path.name) or {"accessed": path.stat().st_mtime}
+            if "size" not in entry:
+                entry["size"] = get_dir_size(path)
+            entries[path.name] = entry
+        return entries
+
+    def remove(self, keys: list):
+        for key in keys:
+            shutil.rmtree(self.root.joinpath(key), ignore_errors=True)
+        with _index_lock:
+            index = self.load_index()
+            for key in keys:
+                index.pop(key, None)
+            self.save_index(index)
+
+    def remove_stale(self) -> int:
+        freed = 0
+        for path in self.root.glob("*.tmp"):
+            if path.is_dir() and time.time() - path.stat().st_mtime > STALE_TEMP_SECONDS:
+                freed += get_dir_size(path)
+                shutil.rmtree(path, ignore_errors=True)
+        return freed
+
+
+class FileStore:
+    """
+    每个key对应一个文件的缓存目录，如制种断点和分块哈希。
+    没有index.json，以文件的修改时间作为最近使用时间，读取缓存时需要调用touch更新
+    """
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self.root = get_cache_dir(namespace)
+
+    @staticmethod
+    def touch(path: Path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def entries(self) -> dict:
+        entries = {}
+        for path in self.root.iterdir():
+            if not path.is_file() or path.suffix == ".tmp":
+                continue
+            st = path.stat()
+            entries[path.name] = {"size": st.st_size, "accessed": st.st_mtime}
+        return entries
+
+    def remove(self, keys: list):
+        for key in keys:
+            try:
+                self.root.joinpath(key).unlink()
+            except OSError:
+                # 正在写入的断点在Windows上无法删除，留到下次清理
+                pass
+
+    def remove_stale(self) -> int:
+        freed = 0
+        for path in self.root.glob("*.tmp"):
+            st = path.stat()
+            if path.is_file() and time.time() - st.st_mtime > STALE_TEMP_SECONDS:
+                freed += st.st_size
+                self.remove([path.name])
+        return freed
+
+
+# 不使用index.json的缓存目录
+FILE_STORES = ("checkpoints", "piece_hashes")
+
+
+def get_stores() -> List[Union[ArtifactStore, FileStore]]:
+    root = get_cache_dir()
+    # 带有index.json的目录是ArtifactStore，制种断点和分块哈希按文件管理，同样参与统计和清理
+    stores = [ArtifactStore(p.name) for p in sorted(root.iterdir()) if p.joinpath("index.json").is_file()]
+    return stores + [FileStore(name) for name in FILE_STORES]
+
+
+def cache_stats() -> Dict[str, Tuple[int, int]]:
+    stats = {}
+    for store in get_stores():
+        entries = store.entries()
+        stats[store.namespace] = (len(entries), sum(e["size"] for e in entries.values()))
+    return stats
+
+
+def prune_cache(max_size: int, keep: tuple = None, clear: bool = False) -> Tuple[int, int]:
+    # 所有缓存共享同一个大小上限，超出时按最近使用时间淘汰最旧的条目；max_size为0时不限制，clear时清空所有条目
+    stores = get_stores()
+    freed = sum(store.remove_stale() for store in stores)
+    entries = [
+        (entry["accessed"], entry["size"], store, key)
+        for store in stores
+        for key, entry in store.entries().items()
+    ]
+    total = sum(e[1] for e in entries)
+    evicted = {}
+    count = 0
+    for accessed, size, store, key in sorted(entries, key=lambda e: e[0]):
+        if not clear and (not max_size or total <= max_size):
+            break
+        if keep == (store.namespace, key):
+            continue
+        evicted.setdefault(store, []).append(key)
+        total -= size
+        freed += size
+        count += 1
+    for store, keys in evicted.items():
+        logger.debug(f"正在清理缓存{store.namespace}: {keys}")
+        store.remove(keys)
+    return count, freed
+
+
+def cache_command(action: str, max_size: int, clear: bool = False):
+    if action == "prune":
+        count, freed = prune_cache(max_size, clear=clear)
+        logger.info(f"已清理{count}个缓存条目，释放{format_size(freed)}")
+    stats = cache_stats()
+    logger.info(
+        f"缓存目录：{get_cache_dir()}\n"
+        + "".join(f"{n}: {c}个条目，{format_size(s)}\n" for n, (c, s) in stats.items())
+        + f"总计: {format_size(sum(s for _, s in stats.values()))} / {format_size(max_size) if max_size else '不限制'}"
+    )
@@ -1,7 +1,7 @@
 import argparse
 from configparser import RawConfigParser
 
-from differential.constants import ImageHosting, BOOLEAN_ARGS, BOOLEAN_STATES
+from differential.constants import ImageHosting, ScreenshotMode, BOOLEAN_ARGS, BOOLEAN_STATES
 
 
 def merge_config(args: argparse.Namespace, section: str = '') -> dict:
@@ -17,7 +17,7 @@ def merge_config(args: argparse.Namespace, section: str = '') -> dict:
             merged[arg] = config.defaults()[arg]
 
         # Then use the args from config file matching the plugin name
-        if args.plugin in config.sections():
+        if getattr(args, 'plugin', None) in config.sections():
             for arg in config[args.plugin].keys():
                 merged[arg] = config[args.plugin][arg]
 
@@ -35,6 +35,8 @@ def merge_config(args: argparse.Namespace, section: str = '') -> dict:
     # Handling non-str non-int args
     if 'image_hosting' in merged:
         merged['image_hosting'] = ImageHosting.parse(merged['image_hosting'])
+    if 'screenshot_mode' in merged:
+        merged['screenshot_mode'] = ScreenshotMode.parse(merged['screenshot_mode'])
     if any(arg in BOOLEAN_ARGS for arg in merged.keys()):
         for arg in BOOLEAN_ARGS:
             if arg in merged and not isinstance(merged[arg], bool):
@@ -0,0 +1,454 @@
+import os
+import json
+import mmap
+import random
+import struct
+import hashlib
+from pathlib import Path
+from bisect import bisect_right
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from loguru import logger
+
+from differential.utils.cache import FileStore, get_cache_dir
+
+# 每次读取的数据量，会向下对齐到分块大小的整数倍，至少为一个分块
+DEFAULT_READ_SIZE = 16 * 1024 * 1024
+# 断点文件中每条记录的格式：分块序号 + SHA1
+CHECKPOINT_RECORD = struct.Struct(">I20s")
+# buffered: 读入缓冲区后计算；mmap: 映射文件后直接对内存切片计算，没有复制
+HASH_BACKENDS = ("buffered", "mmap")
+
+
+class PieceLayout:
+    """把多个文件看作一个连续的字节流，按分块大小切分。路径为None的文件表示全零的填充数据"""
+
+    def __init__(self, files: List[Tuple[Optional[str], int]], piece_size: int):
+        self.files = files
+        self.piece_size = piece_size
+        self.offsets = []
+        total = 0
+        for _, size in files:
+            self.offsets.append(total)
+            total += size
+        self.total_size = total
+        self.piece_count = (total + piece_size - 1) // piece_size
+
+    def piece_range(self, index: int) -> Tuple[int, int]:
+        start = index * self.piece_size
+        return start, min(start + self.piece_size, self.total_size)
+
+    def spans(self, start: int, end: int):
+        # 返回[start, end)覆盖的每个文件的(文件序号, 文件内偏移, 长度)
+        i = bisect_right(self.offsets, start) - 1
+        while start < end and i < len(self.files):
+            file_start = self.offsets[i]
+            file_end = file_start + self.files[i][1]
+            if file_end > start:
+                length = min(end, file_end) - start
+                yield i, start - file_start, length
+                start += length
+            i += 1
+
+    def segments(self, read_size: int) -> List[Tuple[int, int]]:
+        pieces_per_read = max(1, read_size // self.piece_size)
+        return [
+            (first, min(first + pieces_per_read, self.piece_count))
+            for first in range(0, self.piece_count, pieces_per_read)
+        ]
+
+
+class HashCheckpoint:
+    """
+    记录已经完成的分块哈希，制种中断后可以从断点继续。
+    文件第一行是描述文件列表和分块大小的JSON，之后是追加写入的定长记录
+    """
+
+    def __init__(self, layout: PieceLayout, stats: List[Optional[os.stat_result]]):
+        header = {
+            "piece_size": layout.piece_size,
+            "files": [[path, size, st.st_mtime_ns if st else 0] for (path, size), st in zip(layout.files, stats)],
+        }
+        self.header = json.dumps(header, sort_keys=True).encode()
+        key = hashlib.sha1(self.header).hexdigest()
+        self.path = get_cache_dir("checkpoints").joinpath(f"{key}.ckpt")
+        self.file = None
+
+    def load(self) -> Dict[int, bytes]:
+        hashes = {}
+        if not self.path.is_file():
+            return hashes
+        with open(self.path, "rb") as f:
+            if f.readline().rstrip(b"\n") != self.header:
+                return hashes
+            data = f.read()
+        # 最后一条记录可能因为中断而不完整，直接忽略
+        usable = len(data) - len(data) % CHECKPOINT_RECORD.size
+        for index, piece_hash in CHECKPOINT_RECORD.iter_unpack(data[:usable]):
+            hashes[index] = piece_hash
+        return hashes
+
+    def open(self, resumed: bool):
+        if resumed:
+            self.file = open(self.path, "ab")
+        else:
+            self.file = open(self.path, "wb")
+            self.file.write(self.header + b"\n")
+
+    def append(self, first: int, hashes: List[bytes]):
+        self.file.write(b"".join(CHECKPOINT_RECORD.pack(first + i, h) for i, h in enumerate(hashes)))
+        self.file.flush()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def remove(self):
+        self.close()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def read_segment(layout: PieceLayout, first: int, last: int) -> Tuple[memoryview, int]:
+    # 一次读取连续的多个分块，返回数据和起始位置，避免逐块读取的开销
+    start, _ = layout.piece_range(first)
+    _, end = layout.piece_range(last - 1)
+    buffer = bytearray(end - start)
+    view = memoryview(buffer)
+    pos = 0
+    for i, offset, length in layout.spans(start, end):
+        if layout.files[i][0] is None:
+            # 缓冲区初始为全零，填充数据直接跳过
+            pos += length
+            continue
+        with open(layout.files[i][0], "rb", buffering=0) as f:
+            f.seek(offset)
+            while length > 0:
+                n = f.readinto(view[pos:pos + length])
+                if not n:
+                    raise OSError(f"读取文件失败，文件大小可能已改变：{layout.files[i][0]}")
+                pos += n
+                length -= n
+    return view, start
+
+
+def hash_segment(layout: PieceLayout, first: int, last: int) -> List[bytes]:
+    view, start = read_segment(layout, first, last)
+    hashes = []
+    for index in range(first, last):
+        piece_start, piece_end = layout.piece_range(index)
+        hashes.append(hashlib.sha1(view[piece_start - start:piece_end - start]).digest())
+    return hashes
+
+
+class MappedFiles:
+    """只读映射所有文件，并提示内核按顺序读取"""
+
+    def __init__(self, layout: PieceLayout):
+        self.maps: List[Optional[mmap.mmap]] = []
+        for path, size in layout.files:
+            if size == 0 or path is None:
+                # 空文件无法映射，也不会被读取；填充数据不需要映射
+                self.maps.append(None)
+                continue
+            with open(path, "rb") as f:
+                if hasattr(os, "posix_fadvise"):
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(m, "madvise"):
+                m.madvise(mmap.MADV_SEQUENTIAL)
+            self.maps.append(m)
+
+    def willneed(self, i: int, offset: int, length: int):
+        m = self.maps[i]
+        if m is not None and hasattr(m, "madvise") and hasattr(mmap, "MADV_WILLNEED"):
+            # madvise要求起始地址按页对齐
+            aligned = offset - offset % mmap.PAGESIZE
+            m.madvise(mmap.MADV_WILLNEED, aligned, length + offset - aligned)
+
+    def close(self):
+        for m in self.maps:
+            if m is not None:
+                m.close()
+
+
+def hash_segment_mmap(layout: PieceLayout, maps: MappedFiles, first: int, last: int) -> List[bytes]:
+    start, _ = layout.piece_range(first)
+    _, end = layout.piece_range(last - 1)
+    for i, offset, length in layout.spans(start, end):
+        maps.willneed(i, offset, length)
+    hashes = []
+    for index in range(first, last):
+        sha1 = hashlib.sha1()
+        # 跨文件的分块分多次update，每次都是对映射内存的切片，不产生中间的bytes
+        for i, offset, length in layout.spans(*layout.piece_range(index)):
+            if maps.maps[i] is None:
+                sha1.update(bytes(length))
+                continue
+            with memoryview(maps.maps[i]) as view:
+                sha1.update(view[offset:offset + length])
+        hashes.append(sha1.digest())
+    return hashes
+
+
+def run_segments(
+    segments: List[Tuple[int, int]],
+    func: Callable[[int, int], list],
+    done: Callable[[int, list], None],
+    workers: int = None,
+):
+    """多个线程并行处理各个分段，done在调用线程中按完成顺序执行"""
+    workers = workers or os.cpu_count() or 1
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = {}
+    try:
+        # 只保持有限个正在读取的分段，限制内存占用
+        segments = list(reversed(segments))
+        while segments or pending:
+            while segments and len(pending) < workers * 2:
+                first, last = segments.pop()
+                pending[executor.submit(func, first, last)] = first
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                first = pending.pop(future)
+                done(first, future.result())
+    finally:
+        # cancel_futures需要Python 3.9，出错时手动取消还未开始的分段
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def hash_pieces(
+    files: List[Tuple[str, int]],
+    piece_size: int,
+    workers: int = None,
+    read_size: int = DEFAULT_READ_SIZE,
+    callback: Optional[Callable[[int, int], None]] = None,
+    checkpoint: bool = True,
+    backend: str = "buffered",
+) -> bytes:
+    """计算所有分块的SHA1，多个线程并行读取和计算，并在缓存目录中保存断点"""
+    if backend not in HASH_BACKENDS:
+        raise ValueError(f"不支持的哈希计算方式：{backend}")
+    layout = PieceLayout(files, piece_size)
+    hashes: Dict[int, bytes] = {}
+    ckpt = None
+    if checkpoint:
+        ckpt = HashCheckpoint(layout, [os.stat(path) if path else None for path, _ in files])
+        hashes = ckpt.load()
+        if hashes:
+            logger.info(f"从断点继续制种，已完成{len(hashes)}/{layout.piece_count}个分块")
+        ckpt.open(resumed=bool(hashes))
+
+    segments = [
+        (first, last)
+        for first, last in layout.segments(read_size)
+        if not all(i in hashes for i in range(first, last))
+    ]
+    maps = MappedFiles(layout) if backend == "mmap" and segments else None
+
+    def done(first: int, segment_hashes: List[bytes]):
+        for i, piece_hash in enumerate(segment_hashes):
+            hashes[first + i] = piece_hash
+        if ckpt:
+            ckpt.append(first, segment_hashes)
+        if callback:
+            callback(len(hashes), layout.piece_count)
+
+    try:
+        if maps:
+            run_segments(segments, lambda first, last: hash_segment_mmap(layout, maps, first, last), done, workers)
+        else:
+            run_segments(segments, lambda first, last: hash_segment(layout, first, last), done, workers)
+    finally:
+        if maps:
+            maps.close()
+        if ckpt:
+            ckpt.close()
+
+    if ckpt:
+        ckpt.remove()
+    return b"".join(hashes[i] for i in range(layout.piece_count))
+
+
+def padding_size(size: int, piece_size: int) -> int:
+    return -size % piece_size
+
+
+def padded_files(path: str, size: int, piece_size: int, padded: bool) -> List[Tuple[Optional[str], int]]:
+    files = [(path, size)]
+    if padded and padding_size(size, piece_size):
+        files.append((None, padding_size(size, piece_size)))
+    return files
+
+
+def piece_cache_path(path: str, st: os.stat_result, piece_size: int, padded: bool) -> Path:
+    key = hashlib.sha1(
+        json.dumps([os.path.basename(path), st.st_size, st.st_mtime_ns, piece_size, padded]).encode()
+    ).hexdigest()
+    return get_cache_dir("piece_hashes").joinpath(f"{key}.bin")
+
+
+def load_piece_cache(cache: Path, count: int) -> Optional[bytes]:
+    if cache.is_file():
+        pieces = cache.read_bytes()
+        if len(pieces) == count * 20:
+            # 更新最近使用时间，清理缓存时优先保留
+            FileStore.touch(cache)
+            return pieces
+    return None
+
+
+def file_pieces(
+    path: str,
+    piece_size: int,
+    padded: bool,
+    workers: int = None,
+    read_size: int = DEFAULT_READ_SIZE,
+    callback: Optional[Callable[[int, int], None]] = None,
+    backend: str = "buffered",
+) -> bytes:
+    """
+    单独计算一个从分块边界开始的文件的分块哈希，padded时最后一个分块用零填充到分块大小(BEP 47)。
+    结果按文件名、大小和修改时间缓存，文件移动到其他目录后依然有效
+    """
+    st = os.stat(path)
+    count = (st.st_size + piece_size - 1) // piece_size
+    files = padded_files(path, st.st_size, piece_size, padded)
+    # 大小正好是分块整数倍的文件不需要填充
+    padded = len(files) > 1
+    cache = piece_cache_path(path, st, piece_size, padded)
+    pieces = load_piece_cache(cache, count)
+    if pieces is None and count:
+        # 原来是最后一个文件、新增剧集后需要填充(或者相反)时，只有最后一个分块不同
+        other = load_piece_cache(piece_cache_path(path, st, piece_size, not padded), count)
+        if other is not None and padding_size(st.st_size, piece_size):
+            pieces = other[:-20] + hash_segment(PieceLayout(files, piece_size), count - 1, count)[0]
+    if pieces is None:
+        pieces = hash_pieces(files, piece_size, workers, read_size, callback, True, backend)
+        tmp = cache.with_suffix(".tmp")
+        tmp.write_bytes(pieces)
+        os.replace(tmp, cache)
+    elif not cache.is_file():
+        cache.write_bytes(pieces)
+    if callback:
+        callback(count, count)
+    return pieces
+
+
+def sample_pieces(layout: PieceLayout, samples: int) -> List[int]:
+    # 每个文件的首尾分块，再加上随机抽取的分块
+    indices = set()
+    for offset, (_, size) in zip(layout.offsets, layout.files):
+        if size:
+            indices.add(offset // layout.piece_size)
+            indices.add((offset + size - 1) // layout.piece_size)
+    indices.update(random.sample(range(layout.piece_count), min(samples, layout.piece_count)))
+    return sorted(indices)
+
+
+def verify_pieces(
+    files: List[Tuple[str, int]],
+    piece_size: int,
+    pieces: bytes,
+    samples: int = 16,
+    workers: int = None,
+) -> bool:
+    """抽样计算分块哈希，与已有的分块哈希表比较，用于确认复用的种子与文件一致"""
+    layout = PieceLayout(files, piece_size)
+    if len(pieces) != layout.piece_count * 20:
+        logger.warning(f"分块数量不一致：种子中为{len(pieces) // 20}，文件应为{layout.piece_count}")
+        return False
+    indices = sample_pieces(layout, samples)
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        results = executor.map(lambda i: hash_segment(layout, i, i + 1)[0], indices)
+        for index, piece_hash in zip(indices, results):
+            if piece_hash != pieces[index * 20:(index + 1) * 20]:
+                logger.warning(f"第{index}个分块的哈希不一致")
+                return False
+    logger.info(f"抽样校验了{len(indices)}/{layout.piece_count}个分块，与文件一致")
+    return True
+
+
+# BitTorrent v2(BEP 52)的merkle树以16KiB为叶子块，分块大小至少为16KiB且是2的幂
+V2_BLOCK_SIZE = 16 * 1024
+V2_ZERO_HASH = bytes(32)
+
+
+class HybridHashes(NamedTuple):
+    # v1的SHA1分块哈希、v2的piece layer以及文件的pieces root
+    pieces: bytes
+    layer: bytes
+    root: bytes
+
+
+def merkle_root(hashes: List[bytes], width: int, pad: bytes = V2_ZERO_HASH) -> bytes:
+    # width为2的幂，不足的部分用pad补齐
+    layer = list(hashes) + [pad] * (width - len(hashes))
+    while len(layer) > 1:
+        layer = [hashlib.sha256(layer[i] + layer[i + 1]).digest() for i in range(0, len(layer), 2)]
+    return layer[0]
+
+
+def next_power_of_two(n: int) -> int:
+    return 1 << max(n - 1, 0).bit_length()
+
+
+def hash_segment_hybrid(layout: PieceLayout, data_size: int, first: int, last: int) -> List[Tuple[bytes, bytes]]:
+    """
+    同一次读取的数据同时计算v1的SHA1分块哈希(包括末尾的填充数据)，
+    以及v2每个分块对应的merkle子树的根(只计算文件数据，不足一个分块的部分用零哈希补齐)
+    """
+    view, start = read_segment(layout, first, last)
+    blocks_per_piece = layout.piece_size // V2_BLOCK_SIZE
+    # 不超过一个分块的文件没有piece layer，只需补齐到叶子数向上取整的2的幂，得到的就是文件的根
+    single = data_size <= layout.piece_size
+    hashes = []
+    for index in range(first, last):
+        piece_start, piece_end = layout.piece_range(index)
+        piece = view[piece_start - start:piece_end - start]
+        data_end = min(piece_end, data_size) - piece_start
+        leaves = [
+            hashlib.sha256(piece[offset:min(offset + V2_BLOCK_SIZE, data_end)]).digest()
+            for offset in range(0, data_end, V2_BLOCK_SIZE)
+        ]
+        width = next_power_of_two(len(leaves)) if single else blocks_per_piece
+        hashes.append((hashlib.sha1(piece).digest(), merkle_root(leaves, width)))
+    return hashes
+
+
+def hash_file_hybrid(
+    path: str,
+    piece_size: int,
+    padded: bool,
+    workers: int = None,
+    read_size: int = DEFAULT_READ_SIZE,
+    callback: Optional[Callable[[int, int], None]] = None,
+) -> HybridHashes:
+    """一次读取同时计算一个文件的v1分块哈希和v2 merkle树，文件需要从分块边界开始"""
+    if piece_size < V2_BLOCK_SIZE or piece_size & (piece_size - 1):
+        raise ValueError(f"v2种子的分块大小必须是不小于16KiB的2的幂：{piece_size}")
+    size = os.path.getsize(path)
+    layout = PieceLayout(padded_files(path, size, piece_size, padded), piece_size)
+    results: Dict[int, Tuple[bytes, bytes]] = {}
+
+    def done(first: int, segment_hashes: List[Tuple[bytes, bytes]]):
+        for i, piece_hashes in enumerate(segment_hashes):
+            results[first + i] = piece_hashes
+        if callback:
+            callback(len(results), layout.piece_count)
+
+    run_segments(
+        layout.segments(read_size), lambda first, last: hash_segment_hybrid(layout, size, first, last), done, workers
+    )
+    pieces = b"".join(results[i][0] for i in range(layout.piece_count))
+    subtrees = [results[i][1] for i in range(layout.piece_count)]
+    if size <= piece_size:
+        return HybridHashes(pieces, b"", subtrees[0])
+    pad = merkle_root([], piece_size // V2_BLOCK_SIZE)
+    return HybridHashes(pieces, b"".join(subtrees), merkle_root(subtrees, next_power_of_two(len(subtrees)), pad))
@@ -27,4 +27,5 @@ from differential.utils.image.ptpimg import ptpimg_upload
 from differential.utils.image.imgurl import imgurl_upload
 from differential.utils.image.chevereto import chevereto_api_upload, chevereto_cookie_upload, chevereto_username_upload
 from differential.utils.image.cloudinary import cloudinary_upload
-from differential.utils.image.tucang import tucang_upload
\ No newline at end of file
+from differential.utils.image.tucang import tucang_upload
+from differential.utils.image.optimize import optimize_image, encode_image, encode_png
@@ -2,9 +2,9 @@ import re
 from pathlib import Path
 from typing import Optional
 
-import requests
 from loguru import logger
 
+from differential.utils import network
 from differential.utils.image import ImageUploaded
 
 
@@ -13,7 +13,7 @@ def byr_upload(img: Path, authorization: str, url: Optional[str] = None) -> Opti
     params = {'command': 'QuickUpload', 'type': 'Images', 'CKEditor': 'descr', 'CKEditorFuncNum': 2}
     files = {'upload': open(img, 'rb')}
 
-    req = requests.post(f"{'https://byr.pt' if not url else url}/ckfinder/core/connector/php/connector.php", params=params, files=files, headers=headers)
+    req = network.post(f"{'https://byr.pt' if not url else url}/ckfinder/core/connector/php/connector.php", params=params, files=files, headers=headers)
 
     if not req.ok:
         logger.trace(req.content)
@@ -1,20 +1,23 @@
 import re
 import json
+import threading
 from pathlib import Path
 from typing import Optional
 
-import requests
 from loguru import logger
 
+from differential.utils import network
 from differential.utils.image import ImageUploaded
 
 sessions = {}
+# 截图会并发上传，同一账号只登录一次，其他线程等待登录完成后复用会话
+_sessions_lock = threading.Lock()
 
 
 def chevereto_api_upload(img: Path, url: str, api_key: str) -> Optional[ImageUploaded]:
     data = {'key': api_key}
     files = {'source': open(img, 'rb')}
-    req = requests.post(f'{url}/api/1/upload', data=data, files=files)
+    req = network.post(f'{url}/api/1/upload', data=data, files=files)
 
     try:
         res = req.json()
@@ -40,7 +43,7 @@ def chevereto_cookie_upload(img: Path, url: str, cookie: str, auth_token: str) -
     headers = {'cookie': cookie}
     data = {'type': 'file', 'action': 'upload', 'nsfw': 0, 'auth_token': auth_token}
     files = {'source': open(img, 'rb')}
-    req = requests.post(f'{url}/json', data=data, files=files, headers=headers)
+    req = network.post(f'{url}/json', data=data, files=files, headers=headers)
 
     try:
         res = req.json()
@@ -67,29 +70,30 @@ def chevereto_cookie_upload(img: Path, url: str, cookie: str, auth_token: str) -
 
 def with_session(func):
     def wrapper(img: Path, url: str, username: str, password: str):
-        if (username, password) not in sessions:
-            session = requests.Session()
-            req = session.get(url)
-            m = re.search(r'auth_token.*?\"(\w+)\"', req.text)
-            if not m:
-                logger.warning("未找到auth_token，请重试")
-                return
-            auth_token = m.groups()[0]
-            data = {'auth_token': auth_token, 'login-subject': username, 'password': password, 'keep-login': 1}
-            logger.info("正在登录Chevereto...")
-            req = session.post(f"{url}/login", data=data)
-            if not req.ok:
-                logger.warning("Chevereto登录失败，请重试")
-                return
-            sessions[(username, password)] = (session, auth_token)
-        else:
-            session, auth_token = sessions.get((username, password))
+        with _sessions_lock:
+            if (username, password) not in sessions:
+                session = network.new_session()
+                req = session.get(url)
+                m = re.search(r'auth_token.*?\"(\w+)\"', req.text)
+                if not m:
+                    logger.warning("未找到auth_token，请重试")
+                    return
+                auth_token = m.groups()[0]
+                data = {'auth_token': auth_token, 'login-subject': username, 'password': password, 'keep-login': 1}
+                logger.info("正在登录Chevereto...")
+                req = session.post(f"{url}/login", data=data)
+                if not req.ok:
+                    logger.warning("Chevereto登录失败，请重试")
+                    return
+                sessions[(username, password)] = (session, auth_token)
+            else:
+                session, auth_token = sessions.get((username, password))
         return func(session, img, url, auth_token)
     return wrapper
 
 
 @with_session
-def chevereto_username_upload(session: requests.Session, img: Path, url: str, auth_token: str) -> Optional[ImageUploaded]:
+def chevereto_username_upload(session: network.Session, img: Path, url: str, auth_token: str) -> Optional[ImageUploaded]:
     data = {'type': 'file', 'action': 'upload', 'nsfw': 0, 'auth_token': auth_token}
     files = {'source': open(img, 'rb')}
     req = session.post(f'{url}/json', data=data, files=files)
@@ -6,9 +6,9 @@ from pathlib import Path
 from typing import Optional
 from urllib.parse import urlencode
 
-import requests
 from loguru import logger
 
+from differential.utils import network
 from differential.utils.image import ImageUploaded
 
 
@@ -25,7 +25,7 @@ def cloudinary_upload(img: Path, folder: str, cloud_name: str, api_key: str, api
         'file': open(img, "rb"),
     }
 
-    req = requests.post(f'https://api.cloudinary.com/v1_1/{cloud_name}/image/upload', data=data, files=files)
+    req = network.post(f'https://api.cloudinary.com/v1_1/{cloud_name}/image/upload', data=data, files=files)
     try:
         res = req.json()
         logger.trace(res)
@@ -5,15 +5,15 @@ from pathlib import Path
 from typing import Optional, List
 from string import ascii_letters, digits
 
-import requests
 from loguru import logger
 from lxml.html import fromstring
 
+from differential.utils import network
 from differential.utils.image import ImageUploaded
 
 
 def get_uploadid(cookie: str) -> str:
-    req = requests.get("https://img.hdbits.org", headers={"cookie": cookie})
+    req = network.get("https://img.hdbits.org", headers={"cookie": cookie})
     m = re.search(r"uploadid=([a-zA-Z0-9]{15})", req.text)
     if m:
         return m.groups()[0]
@@ -44,7 +44,7 @@ def hdbits_upload(
         files = {
             "file": open(img, "rb"),
         }
-        req = requests.post(
+        req = network.post(
             f"https://img.hdbits.org/upload.php?uploadid={uploadid}",
             data=data,
             files=files,
@@ -63,7 +63,7 @@ def hdbits_upload(
             return None
         logger.info(f"第{count+1}张截图上传成功")
 
-    req = requests.get(f"https://img.hdbits.org/done/{uploadid}", headers=headers)
+    req = network.get(f"https://img.hdbits.org/done/{uploadid}", headers=headers)
     if not req.ok:
         logger.trace(req.content)
         logger.warning(f"图片直链获取失败: HTTP {req.status_code}, reason: {req.reason}")
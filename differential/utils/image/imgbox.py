@@ -5,10 +5,10 @@ from pathlib import Path
 from typing import Optional, List
 from string import ascii_letters, digits
 
-import requests
 from loguru import logger
 from lxml.html import fromstring
 
+from differential.utils import network
 from differential.utils.image import ImageUploaded
 
 
@@ -64,7 +64,7 @@ def imgbox_upload(
     is_family_safe: bool = True,
     allow_comment: bool = False,
 ) -> List[ImageUploaded]:
-    session = requests.Session()
+    session = network.new_session()
     csrf_token = get_csrf_token(session)
     if usernmae and password:
         login(session, usernmae, password, csrf_token)
@@ -2,15 +2,15 @@ import json
 from pathlib import Path
 from typing import Optional
 
-import requests
 from loguru import logger
 
+from differential.utils import network
 from differential.utils.image import ImageUploaded
 
 def imgurl_upload(img: Path, url: str, api_key: str) -> Optional[ImageUploaded]:
     data = {'token': api_key}
     files = {'file': open(img, 'rb')}
-    req = requests.post(f'{url}/api/upload', data=data, files=files)
+    req = network.post(f'{url}/api/upload', data=data, files=files)
 
     try:
         res = req.json()
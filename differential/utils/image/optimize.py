@@ -0,0 +1,98 @@
+import os
+from io import BytesIO
+from typing import Tuple
+
+from PIL import Image
+
+try:
+    import mozjpeg_lossless_optimization
+except ImportError:
+    mozjpeg_lossless_optimization = None
+
+# zlib的压缩策略，对应Pillow保存PNG时的compress_type
+PNG_STRATEGIES = {
+    "default": 0,
+    "filtered": 1,
+    "huffman": 2,
+    "rle": 3,
+    "fixed": 4,
+}
+
+# Pillow保存PNG时默认的压缩等级，作为压缩前大小的参照
+PNG_DEFAULT_LEVEL = 6
+
+
+def reduce_palette(image: Image.Image) -> Image.Image:
+    # 颜色数不超过256时转换为调色板模式，只有在完全无损时才使用
+    if image.mode not in ("RGB", "RGBA") or image.getcolors(256) is None:
+        return image
+    # Pillow 9.1之前没有Image.Quantize枚举
+    quantized = image.quantize(colors=256, method=getattr(Image, "Quantize", Image).FASTOCTREE)
+    if quantized.convert(image.mode).tobytes() != image.tobytes():
+        return image
+    return quantized
+
+
+def encode_png(image: Image.Image, compress_level: int = 9, strategy: str = "default", palette: bool = False) -> bytes:
+    png_io = BytesIO()
+    image.save(
+        png_io,
+        format="PNG",
+        compress_level=compress_level,
+        compress_type=PNG_STRATEGIES.get(strategy, 0),
+    )
+    if palette:
+        reduced = reduce_palette(image)
+        if reduced is not image:
+            # 调色板并不总是更小，取两者中较小的一个
+            palette_png = encode_png(reduced, compress_level, strategy)
+            if len(palette_png) < png_io.tell():
+                return palette_png
+    return png_io.getvalue()
+
+
+def encode_image(
+    image: Image.Image,
+    image_format: str = "png",
+    quality: int = 75,
+    compress_level: int = 9,
+    strategy: str = "default",
+    palette: bool = False,
+) -> Tuple[bytes, int]:
+    """
+    按最终的参数编码截图，同时返回不做压缩时的大小：
+    JPEG为mozjpeg优化前的大小，PNG为按Pillow默认参数编码的大小
+    """
+    if image_format == "jpg":
+        # 编码后直接在内存中做mozjpeg无损优化，只写一次文件
+        jpeg_io = BytesIO()
+        image.convert("RGB").save(jpeg_io, format="JPEG", quality=quality)
+        original = jpeg_io.getvalue()
+        if mozjpeg_lossless_optimization is None:
+            return original, len(original)
+        return mozjpeg_lossless_optimization.optimize(original), len(original)
+    optimized = encode_png(image, compress_level, strategy, palette)
+    if (compress_level, strategy, palette) == (PNG_DEFAULT_LEVEL, "default", False):
+        return optimized, len(optimized)
+    return optimized, len(encode_png(image, PNG_DEFAULT_LEVEL))
+
+
+def optimize_image(path: str, compress_level: int = 9, strategy: str = "default", palette: bool = False) -> Tuple[int, int]:
+    with open(path, "rb") as f:
+        original = f.read()
+    image = Image.open(BytesIO(original))
+    if image.format == "PNG":
+        optimized = encode_png(image, compress_level, strategy, palette)
+    elif image.format == "JPEG" and mozjpeg_lossless_optimization is not None:
+        optimized = mozjpeg_lossless_optimization.optimize(original)
+    else:
+        return len(original), len(original)
+
+    if len(optimized) >= len(original):
+        return len(original), len(original)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(optimized)
+    os.replace(temp_path, path)
+    return len(original), len(optimized)
+
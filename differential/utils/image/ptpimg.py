@@ -2,15 +2,15 @@ import json
 from pathlib import Path
 from typing import Optional
 
-import requests
 from loguru import logger
 
+from differential.utils import network
 from differential.utils.image import ImageUploaded
 
 def ptpimg_upload(img: Path, api_key: str) -> Optional[ImageUploaded]:
     data = {'api_key': api_key}
     files = {'file-upload[0]': open(img, 'rb')}
-    req = requests.post('https://ptpimg.me/upload.php', data=data, files=files)
+    req = network.post('https://ptpimg.me/upload.php', data=data, files=files)
 
     try:
         res = req.json()
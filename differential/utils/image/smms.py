@@ -2,16 +2,16 @@ import json
 from pathlib import Path
 from typing import Optional
 
-import requests
 from loguru import logger
 
+from differential.utils import network
 from differential.utils.image import ImageUploaded
 
 
 def smms_upload(img: Path, api_key: str) -> Optional[ImageUploaded]:
     data = {'Authorization': api_key}
     files = {'smfile': open(img, 'rb'), 'format': 'json'}
-    req = requests.post('https://sm.ms/api/v2/upload', data=data, files=files)
+    req = network.post('https://sm.ms/api/v2/upload', data=data, files=files)
 
     try:
         res = req.json()
@@ -2,16 +2,16 @@ import json
 from pathlib import Path
 from typing import Optional
 
-import requests
 from loguru import logger
 
+from differential.utils import network
 from differential.utils.image import ImageUploaded
 
 
 def tucang_upload(img: Path, token: str) -> Optional[ImageUploaded]:
     data = {'token': token, "folderId": 2128}
     files = {'file': open(img, 'rb')}
-    req = requests.post(f'https://tucang.cc/api/v1/upload', data=data, files=files)
+    req = network.post(f'https://tucang.cc/api/v1/upload', data=data, files=files)
 
     try:
         res = req.json()
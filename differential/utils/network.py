@@ -0,0 +1,76 @@
+import threading
+from typing import Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# 连接超时和读取超时，单位秒
+DEFAULT_TIMEOUT = (10, 60)
+DEFAULT_POOL_SIZE = 16
+
+_config = {
+    "proxy": None,
+    "user_agent": None,
+    "timeout": DEFAULT_TIMEOUT,
+}
+_session: Optional["Session"] = None
+_lock = threading.Lock()
+
+
+class Session(requests.Session):
+    """带有默认超时、代理、User-Agent和连接池的Session，同一主机的请求会复用连接"""
+
+    def __init__(self):
+        super().__init__()
+        self.timeout = _config["timeout"]
+        adapter = HTTPAdapter(pool_connections=DEFAULT_POOL_SIZE, pool_maxsize=DEFAULT_POOL_SIZE)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+        if _config["proxy"]:
+            self.proxies = {"http": _config["proxy"], "https": _config["proxy"]}
+        if _config["user_agent"]:
+            self.headers["User-Agent"] = _config["user_agent"]
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        # requests会用环境变量中的代理覆盖session.proxies，这里显式传入
+        if self.proxies and not kwargs.get("proxies"):
+            kwargs["proxies"] = self.proxies
+        return super().request(method, url, **kwargs)
+
+
+def configure(
+    proxy: Optional[str] = None,
+    user_agent: Optional[str] = None,
+    timeout: Optional[Union[float, Tuple[float, float]]] = None,
+):
+    global _session
+    with _lock:
+        _config["proxy"] = proxy or None
+        _config["user_agent"] = user_agent or None
+        _config["timeout"] = timeout or DEFAULT_TIMEOUT
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def get_session() -> Session:
+    # 所有请求共享同一个Session
+    global _session
+    with _lock:
+        if _session is None:
+            _session = Session()
+        return _session
+
+
+def new_session() -> Session:
+    # 需要登录的图床使用独立的Session，避免cookie互相影响
+    return Session()
+
+
+def get(url: str, params=None, **kwargs) -> requests.Response:
+    return get_session().get(url, params=params, **kwargs)
+
+
+def post(url: str, data=None, json=None, **kwargs) -> requests.Response:
+    return get_session().post(url, data=data, json=json, **kwargs)
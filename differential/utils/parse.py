@@ -1,5 +1,6 @@
 import re
 from pathlib import Path
+from urllib.parse import urlsplit
 
 
 def parse_encoder_log(encoder_log: str):
@@ -28,3 +29,12 @@ def parse_encoder_log(encoder_log: str):
     if m:
         return "\n".join(m.groups())
     return ""
+
+
+def normalize_url(url: str) -> str:
+    # 去掉协议、www.、查询参数和结尾的斜杠，同一个条目的不同写法得到相同的结果
+    parts = urlsplit(url.strip() if "://" in url else f"https://{url.strip()}")
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return f"{host}{parts.path.rstrip('/')}"
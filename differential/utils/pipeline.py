@@ -0,0 +1,55 @@
+import threading
+from queue import Queue
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from loguru import logger
+
+
+class Stage:
+    """
+    流水线中的一个阶段：多个线程从有界队列中取出任务处理，结果交给下一阶段，
+    最后一个阶段的结果保存在results中。队列满时put会阻塞，上游因此不会无限堆积任务。
+    """
+
+    def __init__(
+        self,
+        func: Callable[[Hashable, Any], Any],
+        workers: int = 1,
+        next_stage: Optional["Stage"] = None,
+        maxsize: int = 0,
+    ):
+        self.func = func
+        self.next_stage = next_stage
+        self.results: Dict[Hashable, Any] = {}
+        self.queue = Queue(maxsize or workers * 2)
+        self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(max(workers, 1))]
+        for thread in self.threads:
+            thread.start()
+
+    def _run(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                break
+            key, item = task
+            try:
+                result = self.func(key, item)
+            except Exception as e:
+                logger.warning(f"处理{item}出错: {e}")
+                result = None
+            if self.next_stage is None:
+                self.results[key] = result
+            elif result is not None:
+                self.next_stage.put(key, result)
+
+    def put(self, key: Hashable, item: Any):
+        self.queue.put((key, item))
+
+    def close(self):
+        # 等待本阶段的任务全部完成后再关闭下一阶段
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        if self.next_stage is not None:
+            self.next_stage.close()
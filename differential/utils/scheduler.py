@@ -0,0 +1,134 @@
+import time
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, Future, wait
+
+from loguru import logger
+
+
+class StagePool(Enum):
+    CPU = "cpu"
+    IO = "io"
+    NETWORK = "network"
+
+
+class StageStatus(Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    SKIPPED = "skipped"
+
+
+# 各资源池同时运行的阶段数，阶段内部的并行由阶段自己控制
+POOL_WORKERS = {
+    StagePool.CPU: 1,
+    StagePool.IO: 2,
+    StagePool.NETWORK: 4,
+}
+
+
+class PrepStage:
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[], Any],
+        requires: List[str],
+        pool: StagePool,
+        output: Optional[str],
+    ):
+        self.name = name
+        self.func = func
+        self.requires = requires
+        self.pool = pool
+        self.output = output
+        self.status = StageStatus.PENDING
+        self.elapsed = 0.0
+
+    def run(self) -> Any:
+        start = time.time()
+        try:
+            return self.func()
+        finally:
+            self.elapsed = time.time() - start
+
+
+class StageScheduler:
+    """
+    按依赖关系执行准备阶段，每个阶段声明依赖的阶段、使用的资源池以及结果保存到target的哪个属性，
+    依赖都完成后阶段才会被提交到对应的资源池
+    """
+
+    def __init__(self, target: object):
+        self.target = target
+        self.stages: Dict[str, PrepStage] = {}
+
+    def add(
+        self,
+        name: str,
+        func: Callable[[], Any],
+        requires: List[str] = None,
+        pool: StagePool = StagePool.CPU,
+        output: Optional[str] = None,
+    ):
+        self.stages[name] = PrepStage(name, func, list(requires or []), pool, output)
+
+    def require(self, name: str, *requires: str):
+        # 给已有的阶段增加依赖，插件可以借此在基础流程中插入自己的阶段
+        self.stages[name].requires.extend(requires)
+
+    def _ready(self, stage: PrepStage) -> bool:
+        return stage.status == StageStatus.PENDING and all(
+            self.stages[r].status == StageStatus.DONE for r in stage.requires if r in self.stages
+        )
+
+    def run(self):
+        for stage in self.stages.values():
+            missing = [r for r in stage.requires if r not in self.stages]
+            if missing:
+                raise ValueError(f"阶段{stage.name}依赖的阶段不存在: {missing}")
+
+        executors = {pool: ThreadPoolExecutor(max_workers=n) for pool, n in POOL_WORKERS.items()}
+        running: Dict[Future, PrepStage] = {}
+        error: Optional[BaseException] = None
+        try:
+            while True:
+                if error is None:
+                    for stage in self.stages.values():
+                        if self._ready(stage):
+                            stage.status = StageStatus.RUNNING
+                            logger.debug(f"开始阶段: {stage.name}")
+                            running[executors[stage.pool].submit(stage.run)] = stage
+                if not running:
+                    pending = [s.name for s in self.stages.values() if s.status == StageStatus.PENDING]
+                    if pending and error is None:
+                        error = ValueError(f"阶段之间存在循环依赖: {pending}")
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    try:
+                        result = future.result()
+                    except BaseException as e:
+                        # 出错后不再开始新的阶段，等待正在运行的阶段结束后抛出
+                        stage.status = StageStatus.FAILED
+                        error = error or e
+                        continue
+                    stage.status = StageStatus.DONE
+                    if stage.output:
+                        setattr(self.target, stage.output, result)
+                    logger.debug(f"阶段{stage.name}完成，用时{stage.elapsed:.1f}秒")
+        finally:
+            for executor in executors.values():
+                executor.shutdown(wait=False)
+            for stage in self.stages.values():
+                if stage.status == StageStatus.PENDING:
+                    stage.status = StageStatus.SKIPPED
+            logger.debug(self.summary())
+        if error is not None:
+            raise error
+
+    def summary(self) -> str:
+        return "准备阶段：\n" + "\n".join(
+            f"- {s.name} [{s.pool.value}] {s.status.value} {s.elapsed:.1f}s" for s in self.stages.values()
+        )
@@ -0,0 +1,308 @@
+import os
+import re
+import json
+from pathlib import Path
+from bisect import bisect_left
+from decimal import Decimal
+from typing import List, Tuple, Iterator, Optional
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+from loguru import logger
+
+from differential.constants import ScreenshotMode
+from differential.utils.binary import execute, execute_raw, open_process
+from differential.utils.cache import ArtifactStore, get_file_fingerprint
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 单进程截图需要从头读取文件直到最后一张截图的位置，只适合较小或较短的文件
+SINGLE_PASS_MAX_BYTES_PER_SCREENSHOT = 512 * 1024 * 1024
+SINGLE_PASS_MAX_DURATION = 3 * 60 * 60 * 1000
+
+# 候选帧缩小为固定尺寸的灰度图后再评分
+CANDIDATE_WIDTH = 256
+CANDIDATE_HEIGHT = 144
+# 候选帧之间的大致间隔，用于确定每个时间点附近解码的窗口长度
+CANDIDATE_SPACING = 2000
+# 亮度均值超出该范围的候选帧视为黑场或白场
+CANDIDATE_MIN_LUMA = 16
+CANDIDATE_MAX_LUMA = 235
+# 感知哈希的汉明距离不超过该值时视为重复画面
+DUPLICATE_HASH_DISTANCE = 10
+
+
+def get_screenshot_timestamps(duration: Decimal, count: int) -> List[int]:
+    return [int(i * duration / (count + 1)) for i in range(1, count + 1)]
+
+
+def parse_keyframes(ffprobe_out: str) -> List[Tuple[int, int]]:
+    start_time = 0
+    keyframes = []
+    for line in ffprobe_out.splitlines():
+        fields = line.strip().split(",")
+        try:
+            if len(fields) == 1 and fields[0]:
+                start_time = float(fields[0])
+            elif len(fields) == 3 and "K" in fields[2]:
+                keyframes.append((float(fields[0]), int(fields[1]) if fields[1].isdigit() else -1))
+        except ValueError:
+            continue
+    # ffmpeg的-ss和select滤镜使用的时间戳都是相对于容器起始时间的
+    return sorted((int((t - start_time) * 1000), pos) for t, pos in keyframes)
+
+
+def get_keyframe_index(main_file: Path, max_size: int = 0) -> List[Tuple[int, int]]:
+    store = ArtifactStore("keyframes", max_size)
+    key = get_file_fingerprint(main_file)
+    cached_dir = store.get(key)
+    if cached_dir:
+        try:
+            with open(cached_dir.joinpath("keyframes.json"), "r") as f:
+                return [tuple(k) for k in json.load(f)]
+        except (OSError, ValueError):
+            logger.debug(f"关键帧索引损坏，重新生成：{cached_dir}")
+            store.remove([key])
+
+    logger.info("正在生成关键帧索引...")
+    keyframes = parse_keyframes(
+        execute(
+            "ffprobe",
+            (
+                "-v error -select_streams v:0 -show_entries packet=pts_time,pos,flags:format=start_time "
+                f'-of csv=p=0 -i "{main_file.absolute()}"'
+            ),
+        )
+    )
+    if keyframes:
+        temp_dir = store.create(key)
+        with open(Path(temp_dir).joinpath("keyframes.json"), "w") as f:
+            json.dump(keyframes, f)
+        store.commit(key, temp_dir, {"file": main_file.name})
+    return keyframes
+
+
+def snap_to_keyframes(timestamps: List[int], keyframes: List[Tuple[int, int]]) -> List[int]:
+    # 每个时间点对齐到最近且未被使用的关键帧，保证截图互不相同
+    times = [k[0] for k in keyframes]
+    snapped = []
+    last = -1
+    for t in timestamps:
+        i = bisect_left(times, t)
+        if i > 0 and (i == len(times) or t - times[i - 1] <= times[i] - t):
+            i -= 1
+        i = max(i, last + 1)
+        if i >= len(times):
+            snapped.append(t)
+            continue
+        snapped.append(times[i])
+        last = i
+    return snapped
+
+
+def get_screenshot_name(main_file: Path, idx: int, ext: str = "png") -> str:
+    return f"{main_file.stem}.thumb_{str(idx).zfill(2)}.{ext}"
+
+
+def get_codec_args(ext: str) -> str:
+    if ext == "jpg":
+        return "-c:v mjpeg -q:v 2"
+    return "-c:v png"
+
+
+def get_screenshot_pattern(main_file: Path, ext: str = "png") -> str:
+    # ffmpeg image2格式的文件名模板，需要转义文件名中的%
+    return get_screenshot_name(main_file, 0, ext).replace("%", "%%").replace("thumb_00", "thumb_%02d")
+
+
+def choose_screenshot_mode(main_file: Path, duration: Decimal, count: int) -> ScreenshotMode:
+    if count <= 1:
+        return ScreenshotMode.SEEK
+    size = os.stat(main_file).st_size
+    if size <= count * SINGLE_PASS_MAX_BYTES_PER_SCREENSHOT and duration <= SINGLE_PASS_MAX_DURATION:
+        return ScreenshotMode.SINGLE
+    return ScreenshotMode.SEEK
+
+
+def seek_screenshot(main_file: Path, t: int, resolution: str, screenshot_path: str):
+    execute(
+        "ffmpeg",
+        (
+            f'-y -ss {t}ms -skip_frame nokey -i "{main_file.absolute()}" '
+            f'-s {resolution} -vsync 0 -vframes 1 {get_codec_args(Path(screenshot_path).suffix[1:])} "{screenshot_path}"'
+        ),
+    )
+
+
+def get_select_expr(timestamps: List[int]) -> str:
+    # 只解码关键帧，每个时间点选取其后的第一个关键帧
+    return "+".join(
+        f"gte(t,{t / 1000:.3f})*(isnan(prev_selected_t)+lt(prev_selected_t,{t / 1000:.3f}))"
+        for t in timestamps
+    )
+
+
+def remove_screenshots(screenshots: List[str]):
+    for s in screenshots:
+        try:
+            os.remove(s)
+        except FileNotFoundError:
+            pass
+
+
+def single_pass_screenshots(
+    main_file: Path, timestamps: List[int], resolution: str, temp_dir: str, ext: str = "png"
+) -> List[str]:
+    screenshots = [
+        f"{temp_dir}/{get_screenshot_name(main_file, i, ext)}" for i in range(1, len(timestamps) + 1)
+    ]
+    remove_screenshots(screenshots)
+    pattern = get_screenshot_pattern(main_file, ext)
+    execute(
+        "ffmpeg",
+        (
+            f'-y -skip_frame nokey -i "{main_file.absolute()}" '
+            f"-vf \"select='{get_select_expr(timestamps)}'\" -s {resolution} -vsync 0 -frames:v {len(timestamps)} "
+            f'-start_number 1 {get_codec_args(ext)} "{temp_dir}/{pattern}"'
+        ),
+    )
+    if not all(Path(s).is_file() for s in screenshots):
+        # 多个时间点落在同一个关键帧上时截图数量会不足，无法和时间点一一对应
+        logger.debug(f"单进程截图数量不足{len(timestamps)}张")
+        remove_screenshots(screenshots)
+        return []
+    return screenshots
+
+
+def iter_raw_frames(args: str, width: int, height: int) -> Iterator[Image.Image]:
+    # ffmpeg直接输出rgb24原始帧，每一帧读入预先分配好的缓冲区，省去PNG编码、写盘和解码
+    frame_size = width * height * 3
+    proc = open_process("ffmpeg", f"{args} -f rawvideo -pix_fmt rgb24 -")
+    try:
+        while True:
+            buffer = bytearray(frame_size)
+            view = memoryview(buffer)
+            read = 0
+            while read < frame_size:
+                n = proc.stdout.readinto(view[read:])
+                if not n:
+                    break
+                read += n
+            if read < frame_size:
+                break
+            yield Image.frombuffer("RGB", (width, height), buffer, "raw", "RGB", 0, 1)
+    finally:
+        proc.stdout.close()
+        if proc.wait() not in (0, -13):
+            logger.warning(f"ffmpeg exit with return code {proc.returncode}")
+
+
+def seek_frame(main_file: Path, t: int, resolution: str) -> Optional[Image.Image]:
+    width, height = (int(i) for i in resolution.split("x"))
+    args = f'-ss {t}ms -skip_frame nokey -i "{main_file.absolute()}" -s {resolution} -vsync 0 -vframes 1'
+    for image in iter_raw_frames(args, width, height):
+        return image
+    return None
+
+
+def single_pass_frames(main_file: Path, timestamps: List[int], resolution: str) -> Iterator[Image.Image]:
+    width, height = (int(i) for i in resolution.split("x"))
+    args = (
+        f'-skip_frame nokey -i "{main_file.absolute()}" '
+        f"-vf \"select='{get_select_expr(timestamps)}'\" -s {resolution} -vsync 0 -frames:v {len(timestamps)}"
+    )
+    return iter_raw_frames(args, width, height)
+
+
+def decode_candidates(main_file: Path, start: int, length: int) -> Tuple[List[int], "np.ndarray"]:
+    # 解码窗口内所有关键帧的缩略灰度图，并通过showinfo获取每一帧的时间戳
+    out, err = execute_raw(
+        "ffmpeg",
+        (
+            f'-ss {start}ms -skip_frame nokey -i "{main_file.absolute()}" -t {length}ms '
+            f"-vf scale={CANDIDATE_WIDTH}:{CANDIDATE_HEIGHT},showinfo -vsync 0 -f rawvideo -pix_fmt gray -"
+        ),
+    )
+    pts = [int(start + float(t) * 1000) for t in re.findall(r"pts_time:(-?[\d.]+)", err)]
+    frame_size = CANDIDATE_WIDTH * CANDIDATE_HEIGHT
+    count = min(len(pts), len(out) // frame_size)
+    frames = np.frombuffer(out, dtype=np.uint8, count=count * frame_size)
+    return pts[:count], frames.reshape(count, CANDIDATE_HEIGHT, CANDIDATE_WIDTH)
+
+
+def score_frames(frames: "np.ndarray") -> "np.ndarray":
+    frames = frames.astype(np.float32)
+    luma = frames.mean(axis=(1, 2))
+    variance = frames.var(axis=(1, 2))
+    edge = np.abs(np.diff(frames, axis=1)).mean(axis=(1, 2)) + np.abs(np.diff(frames, axis=2)).mean(axis=(1, 2))
+    scores = np.sqrt(variance) * edge
+    scores[(luma < CANDIDATE_MIN_LUMA) | (luma > CANDIDATE_MAX_LUMA)] = 0
+    return scores
+
+
+def perceptual_hash(frames: "np.ndarray") -> "np.ndarray":
+    # 8x8均值哈希，每一帧得到64位的布尔数组
+    blocks = frames.reshape(
+        len(frames), 8, CANDIDATE_HEIGHT // 8, 8, CANDIDATE_WIDTH // 8
+    ).mean(axis=(2, 4)).reshape(len(frames), 64)
+    return blocks > np.median(blocks, axis=1, keepdims=True)
+
+
+def select_screenshot_timestamps(
+    main_file: Path, timestamps: List[int], duration: Decimal, candidates: int, workers: int = 1
+) -> List[int]:
+    if np is None:
+        logger.warning("未安装numpy，跳过截图筛选")
+        return timestamps
+    logger.info("正在从每个截图时间点附近的候选帧中筛选截图...")
+    gap = duration / (len(timestamps) + 1)
+    half = int(min(gap / 2, candidates * CANDIDATE_SPACING / 2))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        windows = list(
+            executor.map(lambda t: decode_candidates(main_file, max(0, t - half), 2 * half), timestamps)
+        )
+
+    selected = []
+    hashes = []
+    for t, (pts, frames) in zip(timestamps, windows):
+        if not pts:
+            selected.append(t)
+            continue
+        scores = score_frames(frames)
+        frame_hashes = perceptual_hash(frames)
+        order = np.argsort(-scores, kind="stable")
+        for i in order:
+            if all(np.count_nonzero(frame_hashes[i] != h) > DUPLICATE_HASH_DISTANCE for h in hashes):
+                break
+        else:
+            i = order[0]
+        logger.debug(f"截图时间点{t}ms选取了{pts[i]}ms处的候选帧，评分{scores[i]:.1f}")
+        selected.append(pts[i])
+        hashes.append(frame_hashes[i])
+    return selected
+
+
+def make_contact_sheet(
+    main_file: Path,
+    screenshots_dir: str,
+    count: int,
+    output: str,
+    columns: int = 2,
+    tile_width: int = 0,
+    ext: str = "png",
+) -> bool:
+    # 由ffmpeg的tile滤镜逐张拼接，Python中不需要同时打开所有截图和完整画布
+    rows = (count + columns - 1) // columns
+    filters = f"scale={tile_width}:-2," if tile_width else ""
+    quality = "-q:v 2 " if output.lower().endswith((".jpg", ".jpeg")) else ""
+    execute(
+        "ffmpeg",
+        (
+            f'-y -start_number 1 -i "{screenshots_dir}/{get_screenshot_pattern(main_file, ext)}" '
+            f'-vf "{filters}tile={columns}x{rows}" -frames:v 1 -update 1 {quality}"{output}"'
+        ),
+    )
+    return Path(output).is_file()
@@ -1,70 +1,390 @@
+import os
+import time
 from pathlib import Path
-from typing import List, Optional
+from typing import List, NamedTuple, Optional, Tuple
 from tqdm import tqdm
 import bencodepy
 from torf import Torrent
 from loguru import logger
 
 from differential.version import version
+from differential.utils.bencode import BencodeError, map_file, dict_ranges, decode_range, encode_key, find_key
+from differential.utils.torrent_index import TorrentIndex
+from differential.utils.hashing import (
+    hash_pieces,
+    hash_file_hybrid,
+    padded_files,
+    verify_pieces,
+    file_pieces,
+    padding_size,
+    DEFAULT_READ_SIZE,
+    HASH_BACKENDS,
+)
 
 
-def remake_torrent(path: Path, tracker: str, old_torrent: str) -> Optional[bytes]:
+class TorrentSite(NamedTuple):
+    prefix: Optional[str]
+    tracker: str
+    # 写入info的source字段，不同站点的种子因此有不同的info hash
+    source: Optional[str] = None
+
+
+def parse_torrent_sites(value: str) -> List[TorrentSite]:
+    # 每行（或以分号分隔）一个站点，格式为：前缀|announce地址|source，source可省略，默认与前缀相同
+    sites = []
+    for line in value.replace(";", "\n").splitlines():
+        if not line.strip():
+            continue
+        parts = [p.strip() for p in line.split("|")]
+        if len(parts) < 2 or not parts[1]:
+            logger.warning(f"无法识别的站点配置：{line}")
+            continue
+        prefix, tracker = parts[0], parts[1]
+        source = parts[2] if len(parts) > 2 and parts[2] else prefix
+        sites.append(TorrentSite(prefix or None, tracker, source or None))
+    return sites
+
+
+def torrent_path(path: Path, prefix: str = None) -> Path:
+    return path.resolve().parent.joinpath((f"[{prefix}]." if prefix else '') + f"{path.name if path.is_dir() else path.stem}.torrent")
+
+
+# 洗种时从基础种子中原样复制的info字段，v2和混合种子还需要file tree、meta version以及顶层的piece layers
+REMAKE_INFO_KEYS = (b'file tree', b'files', b'length', b'meta version', b'name', b'piece length', b'pieces')
+
+
+def remake_torrent(path: Path, tracker: str, old_torrent: str, torrent_name: Path, source: str = None) -> bool:
+    """
+    基于已有的种子生成新种子并写入torrent_name。只定位基础种子中info各字段的字节范围，
+    原样拼接到新种子中，不解码也不复制pieces等大字段
+    """
     if not Path(old_torrent).is_file():
-        return None
+        return False
+    # 基础种子可能就是之前生成的同名种子，先写入临时文件，解除映射后再替换，避免截断正在读取的文件
+    temp_name = Path(f"{torrent_name}.tmp")
     try:
-        with open(old_torrent, 'rb') as f:
-            t = f.read()
-            torrent = bencodepy.decode(t)
-    except:
-        import traceback
-        traceback.print_exc()
-        return None
-
-    _name = torrent.get(b'info', {}).get(b'name').decode()
-    if _name != path.name:
-        logger.warning(f"洗种的基础种子很可能不匹配！基础种子文件名为：{_name}，而将要制种的文件名为：{path.name}")
-
-    new_torrent = {}
-    if tracker:
-        new_torrent[b'announce'] = tracker
-    new_torrent[b'created by'] = f"Differential {version}"
-    new_torrent[b'comment'] = f"Generate by Differential {version} made by XGCM"
-    new_torrent[b'info'] = {b'private': 1}
-    for k, v in torrent[b'info'].items():
-        if k in (b'length', b'files', b'name', b'piece length', b'pieces'):
-            new_torrent[b'info'][k] = v
-    return bencodepy.encode(new_torrent)
-
-
-def make_torrent_progress(torrent, filepath, pieces_done, pieces_total):
+        with map_file(old_torrent) as buf:
+            info = dict_ranges(buf, find_key(buf, 0, b'info'))
+            if not all(k in info for k in (b'name', b'piece length', b'pieces')):
+                raise BencodeError("info中缺少必需的字段")
+
+            _name = decode_range(buf, info[b'name']).decode()
+            if _name != path.name:
+                logger.warning(f"洗种的基础种子很可能不匹配！基础种子文件名为：{_name}，而将要制种的文件名为：{path.name}")
+
+            new_info = {k: info[k] for k in REMAKE_INFO_KEYS if k in info}
+            new_info[b'private'] = bencodepy.encode(1)
+            if source:
+                new_info[b'source'] = bencodepy.encode(source)
+            new_torrent = {
+                b'created by': bencodepy.encode(f"Differential {version}"),
+                b'comment': bencodepy.encode(f"Generate by Differential {version} made by XGCM"),
+            }
+            if tracker:
+                new_torrent[b'announce'] = bencodepy.encode(tracker)
+            if b'meta version' in info:
+                top = dict_ranges(buf)
+                if b'piece layers' in top:
+                    new_torrent[b'piece layers'] = top[b'piece layers']
+
+            with open(temp_name, 'wb') as f, memoryview(buf) as view:
+                def write_dict(items: dict):
+                    # bencode要求字典的键按字节序排列
+                    f.write(b'd')
+                    for k in sorted(items):
+                        f.write(encode_key(k))
+                        v = items[k]
+                        if isinstance(v, dict):
+                            write_dict(v)
+                        elif isinstance(v, tuple):
+                            f.write(view[v[0]:v[1]])
+                        else:
+                            f.write(v)
+                    f.write(b'e')
+
+                write_dict({**new_torrent, b'info': new_info})
+        os.replace(temp_name, torrent_name)
+    except (OSError, ValueError) as e:
+        logger.warning(f"无法基于{old_torrent}制种：{e}")
+        try:
+            os.remove(temp_name)
+        except FileNotFoundError:
+            pass
+        return False
+    return True
+
+
+def is_padding(file: dict) -> bool:
+    return b'p' in file.get(b'attr', b'')
+
+
+def verify_torrent(path: Path, old_torrent: Path, samples: int = 16, workers: int = None) -> bool:
+    # 先比较文件列表和大小，再抽样计算分块哈希
+    try:
+        with map_file(old_torrent) as buf:
+            info = dict_ranges(buf, find_key(buf, 0, b'info'))
+            piece_size = decode_range(buf, info[b'piece length'])
+            if b'files' in info:
+                # BEP 47的填充文件不存在于磁盘上，按全零数据计算
+                expected = [
+                    (None if is_padding(f) else path.joinpath(*(p.decode() for p in f[b'path'])), f[b'length'])
+                    for f in decode_range(buf, info[b'files'])
+                ]
+            else:
+                expected = [(path, decode_range(buf, info[b'length']))]
+            # pieces只取字符串内容部分，跳过长度前缀
+            start, end = info[b'pieces']
+            pieces = buf[buf.find(b':', start) + 1:end]
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"无法读取种子{old_torrent}：{e}")
+        return False
+
+    for fp, length in expected:
+        if fp is None:
+            continue
+        if not fp.is_file():
+            logger.warning(f"种子{old_torrent.name}中的文件不存在：{fp}")
+            return False
+        if fp.stat().st_size != length:
+            logger.warning(f"种子{old_torrent.name}中的文件大小不一致：{fp}")
+            return False
+    if path.is_dir():
+        actual = {Path(fp).resolve() for fp in Torrent(path=path).filepaths}
+        if actual - {fp.resolve() for fp, _ in expected if fp}:
+            logger.warning(f"种子{old_torrent.name}中缺少部分文件")
+            return False
+    return verify_pieces(
+        [(str(fp) if fp else None, length) for fp, length in expected], piece_size, pieces, samples, workers
+    )
+
+
+def make_torrent_progress(pieces_done, pieces_total):
     tqdm.write(f'制种进度: {pieces_done/pieces_total*100:3.0f} %', end='\r')
 
 
-def make_torrent(path: Path, tracker: str, prefix: str = None, reuse_torrent: bool = True, from_torrent: str = None):
-    torrent_name = path.resolve().parent.joinpath((f"[{prefix}]." if prefix else '') + f"{path.name if path.is_dir() else path.stem}.torrent")
+def generate_pieces(t: Torrent, workers: int = None, read_size: int = DEFAULT_READ_SIZE, backend: str = "buffered",
+                    callback=make_torrent_progress, checkpoint: bool = True):
+    if backend == "torf":
+        # torf自带的实现，不支持断点
+        t.generate(threads=workers, callback=lambda _t, _f, done, total: callback(done, total) if callback else None,
+                   interval=1)
+        return
+    files = [(str(fp), os.path.getsize(fp)) for fp in t.filepaths]
+    t.metainfo['info']['pieces'] = hash_pieces(files, t.piece_size, workers, read_size, callback, checkpoint, backend)
+
+
+def aligned_files(path: Path, hybrid: bool = False) -> List[Path]:
+    if path.is_file():
+        return [path]
+    filepaths = [Path(fp) for fp in Torrent(path=path).filepaths]
+    if hybrid:
+        # v2的file tree按路径各级的字节序排列，v1的文件列表需要与之一致
+        filepaths.sort(key=lambda fp: [p.encode() for p in fp.relative_to(path).parts])
+    return filepaths
+
+
+def aligned_info(
+    path: Path,
+    piece_size: int = 0,
+    workers: int = None,
+    read_size: int = DEFAULT_READ_SIZE,
+    backend: str = "buffered",
+    hybrid: bool = False,
+) -> Tuple[dict, dict]:
+    """
+    生成每个文件都从分块边界开始的info(BEP 47)，文件之间插入填充文件。
+    每个文件的分块哈希互不影响，可以单独缓存，连载剧集新增一集时只需要计算新文件。
+    hybrid时同时生成v2(BEP 52)的file tree，返回info和种子顶层的piece layers
+    """
+    if backend == "torf":
+        # torf只能整体计算分块哈希，无法按文件单独计算和缓存，对齐分块时改为分段读取
+        logger.info("分块对齐的种子不支持torf的实现，改用buffered计算哈希")
+        backend = "buffered"
+    piece_size = piece_size or Torrent(path=path).piece_size
+    filepaths = aligned_files(path, hybrid)
+    sizes = [fp.stat().st_size for fp in filepaths]
+    total = sum((size + piece_size - 1) // piece_size for size in sizes)
+    files, pieces = [], []
+    file_tree, piece_layers = {}, {}
+    done = 0
+    for i, (fp, size) in enumerate(zip(filepaths, sizes)):
+        parts = [p.encode() for p in fp.relative_to(path).parts] if path.is_dir() else [path.name.encode()]
+        files.append({b'length': size, b'path': parts})
+        node = {b'length': size}
+        if size:
+            # 混合种子与libtorrent一致，多文件时最后一个文件也要填充
+            padded = i < len(filepaths) - 1 or (hybrid and path.is_dir())
+            progress = lambda pieces_done, _, before=done: make_torrent_progress(before + pieces_done, total)
+            if hybrid:
+                hashes = hash_file_hybrid(str(fp), piece_size, padded, workers, read_size, progress)
+                pieces.append(hashes.pieces)
+                node[b'pieces root'] = hashes.root
+                if hashes.layer:
+                    piece_layers[hashes.root] = hashes.layer
+            else:
+                pieces.append(file_pieces(str(fp), piece_size, padded, workers, read_size, progress, backend))
+            done += len(pieces[-1]) // 20
+            pad = padding_size(size, piece_size)
+            if padded and pad:
+                files.append({b'attr': b'p', b'length': pad, b'path': [b'.pad', str(pad).encode()]})
+        if hybrid:
+            tree = file_tree
+            for part in parts[:-1]:
+                tree = tree.setdefault(part, {})
+            tree[parts[-1]] = {b'': node}
+
+    info = {
+        b'name': path.name.encode(),
+        b'piece length': piece_size,
+        b'pieces': b''.join(pieces),
+        b'private': 1,
+    }
+    if path.is_dir():
+        info[b'files'] = files
+    else:
+        info[b'length'] = sizes[0]
+    if hybrid:
+        info[b'file tree'] = file_tree
+        info[b'meta version'] = 2
+    return info, piece_layers
+
+
+def benchmark_hashing(path: Path, backends: List[str] = None, workers: int = None,
+                      read_size: int = DEFAULT_READ_SIZE, rounds: int = 2, hybrid: bool = False):
+    # 依次用各个方式计算同一个目标的分块哈希，比较速度并确认结果一致
+    backends = backends or ["torf", *HASH_BACKENDS]
+    t = Torrent(path=path)
+    logger.info(f"测试目标：{path}，大小{t.size / 1024 / 1024:.1f} MiB，分块大小{t.piece_size // 1024} KiB")
+
+    def timed(name, func):
+        best, result = None, None
+        for _ in range(rounds):
+            start = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        logger.info(f"{name}: {best:.2f}秒，{t.size / 1024 / 1024 / best:.1f} MiB/s")
+        return result
+
+    def generate(backend):
+        generate_pieces(t, workers, read_size, backend, callback=None, checkpoint=False)
+        return t.metainfo['info']['pieces']
+
+    results = {backend: timed(backend, lambda: generate(backend)) for backend in backends}
+    if len(set(results.values())) > 1:
+        logger.error("各个方式计算的分块哈希不一致！")
+
+    if hybrid:
+        # 混合种子的文件按分块对齐，与同样对齐的v1种子比较，两者的v1分块哈希应当一致
+        filepaths = [fp for fp in aligned_files(path, hybrid=True) if fp.stat().st_size]
+        padded = path.is_dir()
+        v1 = timed("v1 (分块对齐)", lambda: b"".join(
+            hash_pieces(padded_files(str(fp), fp.stat().st_size, t.piece_size, padded), t.piece_size,
+                        workers, read_size, checkpoint=False)
+            for fp in filepaths
+        ))
+        v2 = timed("v1+v2", lambda: b"".join(
+            hash_file_hybrid(str(fp), t.piece_size, padded, workers, read_size).pieces for fp in filepaths
+        ))
+        if v1 != v2:
+            logger.error("混合种子的v1分块哈希与v1种子不一致！")
+
+
+def make_torrents(
+    path: Path,
+    sites: List[TorrentSite],
+    reuse_torrent: bool = True,
+    from_torrent: str = None,
+    workers: int = None,
+    read_size: int = DEFAULT_READ_SIZE,
+    backend: str = "buffered",
+    verify_samples: int = 16,
+    torrent_dirs: List[str] = None,
+    align_files: bool = False,
+    piece_size: int = 0,
+    hybrid: bool = False,
+):
+    """为多个站点制种，只计算一次哈希，各站点的种子只有announce、source和文件名不同"""
+    candidates = []
     if from_torrent and Path(from_torrent).is_file():
-        logger.info(f"正在基于{from_torrent}制作种子...")
-        torrent = remake_torrent(path, tracker, from_torrent)
-        if torrent:
+        candidates.append(Path(from_torrent))
+    if reuse_torrent:
+        candidates.extend(path.resolve().parent.glob(f'*{path.name if path.is_dir() else path.stem}.torrent'))
+        if torrent_dirs:
+            candidates.extend(TorrentIndex(torrent_dirs).find(path))
+    for old_torrent in candidates:
+        if verify_samples and not verify_torrent(path, old_torrent, verify_samples, workers):
+            logger.warning(f"{old_torrent.name}与文件不一致，不会基于它制种")
+            continue
+        logger.info(f"正在基于{old_torrent.name}制作种子...")
+        if all(remake_torrent(path, site.tracker, old_torrent, torrent_path(path, site.prefix), site.source)
+               for site in sites):
+            for site in sites:
+                logger.info(f"种子制作完成：{torrent_path(path, site.prefix).absolute()}")
+            return
+
+    if hybrid or (align_files and path.is_dir()):
+        logger.info("正在生成v1+v2混合种子..." if hybrid else "正在生成分块对齐的种子...")
+        info, piece_layers = aligned_info(path, piece_size, workers, read_size, backend, hybrid)
+        for site in sites:
+            torrent = {
+                b'created by': f"Differential {version}",
+                b'comment': f"Generate by Differential {version} made by XGCM",
+                b'info': {**info, b'source': site.source} if site.source else info,
+            }
+            if site.tracker:
+                torrent[b'announce'] = site.tracker
+            if piece_layers:
+                torrent[b'piece layers'] = piece_layers
+            torrent_name = torrent_path(path, site.prefix)
             with open(torrent_name, 'wb') as f:
-                f.write(torrent)
+                f.write(bencodepy.encode(torrent))
             logger.info(f"种子制作完成：{torrent_name.absolute()}")
-            return
-    if reuse_torrent:
-        for f in path.resolve().parent.glob(f'*{path.name if path.is_dir() else path.stem}.torrent'):
-            logger.info(f"正在基于{f.name}制作种子...")
-            torrent = remake_torrent(path, tracker, f)
-            if torrent:
-                with open(torrent_name, 'wb') as f:
-                    f.write(torrent)
-                logger.info(f"种子制作完成：{torrent_name.absolute()}")
-                return
-        
+        return
+
     logger.info("正在生成种子...")
-    t = Torrent(path=path, trackers=[tracker],
+    t = Torrent(path=path,
                 created_by=f"Differential {version}",
                 comment=f"Generate by Differential {version} made by XGCM")
     t.private = True
-    t.generate(callback=make_torrent_progress, interval=1)
-    t.write(torrent_name, overwrite=True)
-    logger.info(f"种子制作完成：{torrent_name.absolute()}")
+    if piece_size:
+        t.piece_size = piece_size
+    generate_pieces(t, workers, read_size, backend)
+    for site in sites:
+        site_torrent = t.copy()
+        site_torrent.trackers = [site.tracker]
+        site_torrent.source = site.source
+        torrent_name = torrent_path(path, site.prefix)
+        site_torrent.write(torrent_name, overwrite=True)
+        logger.info(f"种子制作完成：{torrent_name.absolute()}")
+
+
+def make_torrent(
+    path: Path,
+    tracker: str,
+    prefix: str = None,
+    reuse_torrent: bool = True,
+    from_torrent: str = None,
+    workers: int = None,
+    read_size: int = DEFAULT_READ_SIZE,
+    backend: str = "buffered",
+    verify_samples: int = 16,
+    torrent_dirs: List[str] = None,
+    align_files: bool = False,
+    piece_size: int = 0,
+    hybrid: bool = False,
+):
+    make_torrents(
+        path,
+        [TorrentSite(prefix, tracker)],
+        reuse_torrent,
+        from_torrent,
+        workers,
+        read_size,
+        backend,
+        verify_samples,
+        torrent_dirs,
+        align_files,
+        piece_size,
+        hybrid,
+    )
@@ -0,0 +1,147 @@
+import os
+import json
+import hashlib
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from torf import Torrent
+from loguru import logger
+
+from differential.utils.cache import get_cache_dir
+from differential.utils.bencode import map_file, dict_ranges, decode_range, find_key
+
+# 不使用index.json，避免被当作ArtifactStore参与缓存清理
+INDEX_FILE = "torrents.json"
+
+
+def files_signature(files: List[Tuple[List[str], int]]) -> str:
+    # 文件列表排序后计算哈希，与种子中的文件顺序无关；单文件种子的路径为空列表
+    return hashlib.sha1(json.dumps(sorted(files), ensure_ascii=False).encode()).hexdigest()
+
+
+def torrent_key(name: str, total_size: int, signature: str) -> str:
+    return f"{name}\t{total_size}\t{signature}"
+
+
+def read_torrent_key(torrent: Path) -> Optional[str]:
+    try:
+        # 只解码需要的字段，跳过pieces
+        with map_file(torrent) as buf:
+            info = dict_ranges(buf, find_key(buf, 0, b"info"))
+            name = decode_range(buf, info[b"name"]).decode(errors="replace")
+            if b"files" in info:
+                # 不计入BEP 47的填充文件
+                files = [
+                    ([p.decode(errors="replace") for p in f[b"path"]], f[b"length"])
+                    for f in decode_range(buf, info[b"files"])
+                    if b"p" not in f.get(b"attr", b"")
+                ]
+            else:
+                files = [([], decode_range(buf, info[b"length"]))]
+    except Exception as e:
+        logger.debug(f"无法读取种子{torrent}：{e}")
+        return None
+    return torrent_key(name, sum(length for _, length in files), files_signature(files))
+
+
+def content_key(path: Path) -> str:
+    if path.is_dir():
+        files = []
+        for fp in Torrent(path=path).filepaths:
+            fp = Path(fp)
+            files.append((list(fp.relative_to(path).parts), fp.stat().st_size))
+    else:
+        files = [([], path.stat().st_size)]
+    return torrent_key(path.name, sum(length for _, length in files), files_signature(files))
+
+
+class TorrentIndex:
+    """
+    BT客户端种子目录的索引，按名称、总大小和文件列表找到对应的种子文件。
+    目录和种子文件的修改时间未变化时不会重新读取，数万个种子也只有第一次需要完整扫描
+    """
+
+    def __init__(self, dirs: List[str]):
+        self.dirs = [str(Path(d).expanduser().resolve()) for d in dirs if d]
+        self.index_file = get_cache_dir("torrent_index").joinpath(INDEX_FILE)
+        self.index = self.load()
+        self.keys: Dict[str, List[str]] = {}
+
+    def load(self) -> dict:
+        if self.index_file.is_file():
+            try:
+                with open(self.index_file, "r") as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass
+        return {"dirs": {}, "torrents": {}}
+
+    def save(self):
+        tmp = self.index_file.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.index, f, ensure_ascii=False)
+        os.replace(tmp, self.index_file)
+
+    def update(self, path: str, st: os.stat_result) -> bool:
+        # 种子的修改时间和大小未变化时沿用索引中的记录，返回是否重新读取了种子
+        torrents: Dict[str, dict] = self.index["torrents"]
+        cached = torrents.get(path)
+        if cached and cached["mtime"] == st.st_mtime_ns and cached["size"] == st.st_size:
+            return False
+        torrents[path] = {"mtime": st.st_mtime_ns, "size": st.st_size, "key": read_torrent_key(Path(path))}
+        return True
+
+    def refresh(self):
+        dirs: Dict[str, int] = self.index["dirs"]
+        torrents: Dict[str, dict] = self.index["torrents"]
+        changed = False
+        parsed = 0
+        for d in self.dirs:
+            try:
+                dir_mtime = os.stat(d).st_mtime_ns
+            except OSError:
+                logger.warning(f"种子目录不存在：{d}")
+                continue
+            if dirs.get(d) == dir_mtime:
+                # 原地改写种子不会改变目录的修改时间，已知的种子仍需逐个比较
+                for p in [p for p in torrents if os.path.dirname(p) == d]:
+                    try:
+                        st = os.stat(p)
+                    except OSError:
+                        del torrents[p]
+                        changed = True
+                        continue
+                    if self.update(p, st):
+                        parsed += 1
+                        changed = True
+                continue
+            seen = set()
+            with os.scandir(d) as it:
+                for entry in it:
+                    if not entry.name.endswith(".torrent") or not entry.is_file():
+                        continue
+                    seen.add(entry.path)
+                    if self.update(entry.path, entry.stat()):
+                        parsed += 1
+            for p in [p for p in torrents if os.path.dirname(p) == d and p not in seen]:
+                del torrents[p]
+            dirs[d] = dir_mtime
+            changed = True
+        # 不再配置的目录从索引中移除
+        for d in [d for d in dirs if d not in self.dirs]:
+            del dirs[d]
+            for p in [p for p in torrents if os.path.dirname(p) == d]:
+                del torrents[p]
+            changed = True
+        if changed:
+            self.save()
+        if parsed:
+            logger.info(f"种子索引已更新，读取了{parsed}个种子，共{len(torrents)}个种子")
+        self.keys = {}
+        for p, t in torrents.items():
+            if t["key"]:
+                self.keys.setdefault(t["key"], []).append(p)
+
+    def find(self, path: Path) -> List[Path]:
+        self.refresh()
+        return [Path(p) for p in self.keys.get(content_key(path), []) if os.path.isfile(p)]
@@ -37,6 +37,7 @@ setup(
         "requests",
         "bencode.py==4.0.0",
         "lxml>=4.0.0",
+        "numpy",
     ],
     entry_points={
         "console_scripts": [